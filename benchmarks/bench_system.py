@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Time the System hot paths on synthetic trees of growing size"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import fakesys
+import neptune
+
+BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        "baseline.json")
+# (cpus, pci and usb devices)
+SIZES = ((4, 16), (32, 128), (128, 512))
+REPEAT = 20
+# slowdown against the baseline that counts as a regression
+THRESHOLD = 1.25
+
+
+def timed(function, repeat=REPEAT):
+    """Median time of function in seconds"""
+    times = []
+    for _run in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def run_size(cpus, devices):
+    """Return {operation: seconds} for one tree size"""
+    root = tempfile.mkdtemp(prefix="neptune-bench-")
+    try:
+        fakesys.build(root, cpus=cpus, devices=devices)
+        cache = os.path.join(neptune.CACHE_DIR, "kernel.json")
+
+        def init_cold():
+            """System() without the expansion cache"""
+            if os.path.exists(cache):
+                os.remove(cache)
+            neptune.System()
+
+        results = {"System.__init__ cold": timed(init_cold, 5)}
+        neptune.System()
+        results["System.__init__ cached"] = timed(neptune.System, 5)
+
+        system = neptune.System()
+        profiles = iter(["powersave", "performance"] * REPEAT)
+        results["get_power"] = timed(system.get_power)
+        results["set_power"] = timed(lambda: system.set_power(next(profiles)))
+        results["get_cpu"] = timed(system.get_cpu)
+        results["get_battery"] = timed(system.get_battery)
+        system.reader.close()
+        return results
+    finally:
+        neptune.set_root("")
+        shutil.rmtree(root)
+
+
+def main():
+    """Run all sizes, compare with and optionally save the baseline"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save", action="store_true", default=False,
+                        help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, "r") as fobj:
+            baseline = json.load(fobj)
+
+    results = {}
+    regressions = 0
+    for cpus, devices in SIZES:
+        size = "{0} cpus, {1} devices".format(cpus, devices)
+        results[size] = run_size(cpus, devices)
+        print(size)
+        for operation, seconds in sorted(results[size].items()):
+            reference = baseline.get(size, {}).get(operation)
+            status = ""
+            if reference:
+                ratio = seconds / reference
+                status = "{0:5.2f}x baseline".format(ratio)
+                if ratio > THRESHOLD:
+                    status += " REGRESSION"
+                    regressions += 1
+            print("   {0:24s} {1:9.3f} ms {2}".format(
+                operation, 1000 * seconds, status))
+
+    if args.save:
+        with open(BASELINE, "w") as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
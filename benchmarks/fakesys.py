@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Build a synthetic /sys and /proc tree for neptune.set_root"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import os
+import sys
+import shutil
+import argparse
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import neptune  # noqa: E402 (after the sys.path change)
+
+GOVERNORS = "conservative ondemand userspace powersave performance"
+
+
+def write(fname, value):
+    """Write value to fname, creating the directories"""
+    if not os.path.exists(os.path.dirname(fname)):
+        os.makedirs(os.path.dirname(fname))
+    with open(fname, "w") as fobj:
+        fobj.write("{0}\n".format(value))
+
+
+def build(root, cpus=4, devices=16, backlights=2, batteries=1):
+    """Build a tree under root with cpus CPUs, devices PCI and devices
+    USB devices, and the given number of backlights and batteries.
+    Calls neptune.set_root(root) and installs config/kernel.ini."""
+    neptune.set_root(root)
+
+    for number in range(backlights):
+        path = os.path.join(neptune.BACKLIGHT_DIR,
+                            "acpi_video{0}".format(number))
+        write(os.path.join(path, "max_brightness"), 100 * (number + 1))
+        write(os.path.join(path, "actual_brightness"), 50)
+        write(os.path.join(path, "brightness"), 50)
+
+    # cpufreq policies shared by two hardware threads, cpuN/cpufreq
+    # links to the policy like on the real system
+    for number in range(0, cpus, 2):
+        path = os.path.join(neptune.CPU_DIR, "cpufreq",
+                            "policy{0}".format(number))
+        write(os.path.join(path, "scaling_governor"), "ondemand")
+        write(os.path.join(path, "scaling_available_governors"), GOVERNORS)
+        write(os.path.join(path, "scaling_cur_freq"), 800000 + number)
+        write(os.path.join(path, "related_cpus"), " ".join(
+            "{0}".format(cpu) for cpu in range(number,
+                                               min(number + 2, cpus))))
+    for number in range(cpus):
+        path = os.path.join(neptune.CPU_DIR, "cpu{0}".format(number))
+        os.makedirs(path)
+        os.symlink(os.path.join("..", "cpufreq",
+                                "policy{0}".format(number - number % 2)),
+                   os.path.join(path, "cpufreq"))
+
+    for number in range(batteries):
+        path = os.path.join(neptune.POWER_SUPPLY_DIR,
+                            "BAT{0}".format(number))
+        write(os.path.join(path, "type"), "Battery")
+        write(os.path.join(path, "uevent"), "\n".join([
+            "POWER_SUPPLY_NAME=BAT{0}".format(number),
+            "POWER_SUPPLY_STATUS=Discharging",
+            "POWER_SUPPLY_PRESENT=1",
+            "POWER_SUPPLY_VOLTAGE_MIN_DESIGN=11100000",
+            "POWER_SUPPLY_VOLTAGE_NOW=12000000",
+            "POWER_SUPPLY_CURRENT_NOW=1500000",
+            "POWER_SUPPLY_CHARGE_FULL=5000000",
+            "POWER_SUPPLY_CHARGE_NOW=3000000"]))
+    path = os.path.join(neptune.POWER_SUPPLY_DIR, "AC")
+    write(os.path.join(path, "type"), "Mains")
+    write(os.path.join(path, "online"), 0)
+
+    for number in range(devices):
+        write(os.path.join(root, "sys", "bus", "pci", "devices",
+                           "0000:00:{0:02x}.0".format(number),
+                           "power", "control"), "on")
+        write(os.path.join(root, "sys", "bus", "usb", "devices",
+                           "1-{0}".format(number), "power", "autosuspend"),
+              2)
+    for number in range(4):
+        write(os.path.join(root, "sys", "class", "scsi_host",
+                           "host{0}".format(number),
+                           "link_power_management_policy"),
+              "max_performance")
+
+    # the fixed files of kernel.ini
+    config = os.path.join(ROOT, "config", "kernel.ini")
+    with open(config, "r") as fobj:
+        for line in fobj:
+            line = line.strip()
+            if line.startswith("[/") and "*" not in line:
+                write(root + line[1:-1], 0)
+    if not os.path.exists(neptune.CONFIG_DIR):
+        os.makedirs(neptune.CONFIG_DIR)
+    shutil.copy(config, os.path.join(neptune.CONFIG_DIR, "kernel.ini"))
+
+
+def main():
+    """Build a tree from the command line"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root")
+    parser.add_argument("--cpus", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--backlights", type=int, default=2)
+    parser.add_argument("--batteries", type=int, default=1)
+    args = parser.parse_args()
+    build(os.path.realpath(args.root), args.cpus, args.devices,
+          args.backlights, args.batteries)
+    print("Run with NEPTUNE_ROOT={0}".format(os.path.realpath(args.root)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Check the import time of the entry points against a budget"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import os
+import ast
+import sys
+import subprocess
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+RUNS = 5
+
+# entry point in bin: budget in microseconds for its module-level imports
+BUDGETS = {
+    "neptune_cmd.py": 60000,
+    "neptune_power.py": 60000,
+    "neptune_server.py": 150000,
+    "indicator_neptune.py": 400000}
+
+
+def script_imports(fname):
+    """Return the module-level import statements of a script,
+    without the __future__ imports"""
+    with open(fname, "r") as fobj:
+        tree = ast.parse(fobj.read(), fname)
+    statements = []
+    for node in tree.body:
+        names = ", ".join(
+            alias.name + (" as " + alias.asname if alias.asname else "")
+            for alias in getattr(node, "names", []))
+        if isinstance(node, ast.Import):
+            statements.append("import {0}".format(names))
+        elif isinstance(node, ast.ImportFrom) and \
+                node.module != "__future__":
+            statements.append("from {0}{1} import {2}".format(
+                "." * node.level, node.module or "", names))
+    return statements
+
+
+def top_level_times(source, env):
+    """Return {module: cumulative microseconds} of the modules imported
+    directly by source in a fresh interpreter"""
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", source],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    _stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise ImportError(stderr.decode("utf-8", "replace").strip()
+                          .split("\n")[-1])
+    times = {}
+    for line in stderr.decode("utf-8", "replace").split("\n"):
+        # import time: self [us] | cumulative | imported package,
+        # nested imports are indented
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit() and \
+                not fields[2][1:].startswith(" "):
+            times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def import_time(statements):
+    """Cumulative import time of statements in microseconds, without
+    the modules of the interpreter startup, the fastest of RUNS fresh
+    interpreters"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get("PYTHONPATH")] if path])
+    startup = top_level_times("pass", env)
+    best = None
+    for _run in range(RUNS):
+        times = top_level_times("\n".join(statements), env)
+        total = sum(usec for module, usec in times.items()
+                    if module not in startup)
+        if best is None or total < best:
+            best = total
+    return best
+
+
+def main():
+    """Report the import time of every entry point"""
+    failed = False
+    for entry, budget in sorted(BUDGETS.items()):
+        try:
+            usec = import_time(script_imports(
+                os.path.join(ROOT, "bin", entry)))
+        except ImportError as error:
+            print("{0:22s} skipped ({1})".format(entry, error))
+            continue
+        status = "ok" if usec <= budget else "OVER BUDGET"
+        failed = failed or usec > budget
+        print("{0:22s} {1:8.1f} ms (budget {2:.1f} ms) {3}".format(
+            entry, usec / 1000, budget / 1000, status))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
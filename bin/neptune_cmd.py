@@ -22,6 +22,8 @@ parser.add_argument("--get-brightness", action="store_true", default=False)
 parser.add_argument("--set-brightness", action="store", dest="brightness")
 parser.add_argument("--screen-off", action="store_true", default=False)
 parser.add_argument("--quit", action="store_true", default=False)
+parser.add_argument("--stats", action="store_true", default=False)
+parser.add_argument("--energy", action="store_true", default=False)
 result = parser.parse_args()
 
 try:
@@ -38,42 +40,77 @@ try:
         else:
             sys.exit("Neptune service not running")
 
-    local = neptune.Local()
     remote_object = bus.get_object(neptune.DBUS_SERVICE, neptune.DBUS_PATH)
     iface = dbus.Interface(remote_object, neptune.DBUS_INTERFACE)
 
+    profile = {}
     if result.cpu:
-        iface.set_cpu(result.cpu)
-        msg = "CPU set to {0}".format(iface.get_cpu())
-        iface.emit_info(msg, "")
-        print(msg)
-    if result.get_cpu:
-        print("Current CPU: {0}".format(iface.get_cpu()))
-
+        profile["cpu"] = result.cpu
     if result.power:
-        iface.set_power(result.power)
-        msg = "Power set to {0}".format(iface.get_power())
-        iface.emit_info(msg, "")
-        print(msg)
-    if result.get_power:
-        print("Current power setting: {0}".format(iface.get_power()))
-
+        profile["power"] = result.power
     if result.brightness:
-        iface.set_brightness(result.brightness, "default")
-        msg = "Brightness set to {0}".format(iface.get_brightness("default"))
-        iface.emit_info(msg, "")
-        print(msg)
+        profile["brightness"] = (int(result.brightness)
+                                 if result.brightness.isdigit()
+                                 else result.brightness)
+
+    state = {}
+    if profile:
+        state = iface.apply_profile(dbus.Dictionary(profile, signature="sv"))
+        for fname in state["failed"]:
+            print("Cannot write {0}".format(fname))
+        if result.cpu:
+            print("CPU set to {0}".format(state.get("cpu")))
+        if result.power:
+            print("Power set to {0}".format(state["power"]))
+        if result.brightness:
+            print("Brightness set to {0}".format(
+                state["brightness"].get("default")))
+
+    if not state and (result.get_cpu or result.get_power or
+                      result.get_brightness or result.get_battery):
+        state = iface.get_state()
+
+    if result.get_cpu:
+        print("Current CPU: {0}".format(state.get("cpu")))
+        if state.get("cpu") == "mixed":
+            for policy, governor in sorted(state["cpu_policies"].items()):
+                print("   {0}: {1}".format(policy, governor))
+    if result.get_power:
+        print("Current power setting: {0}".format(state["power"]))
     if result.get_brightness:
         print("Current brightness: {0}".format(
-            iface.get_brightness("default")))
+            state["brightness"].get("default")))
 
     if result.screen_off:
-        local.screen_off()
+        # only here, Local loads the X input modules
+        neptune.Local().screen_off()
 
     if result.get_battery:
         print("Battery:")
-        for key, value in iface.get_battery().items():
+        for key, value in state["battery"].items():
             print("   {0}: {1}".format(key, value))
 
+    if result.stats:
+        print("{0:30s} {1:>7s} {2:>7s} {3:>9s} {4:>9s} {5:>9s}".format(
+            "method.phase", "calls", "errors", "p50 ms", "p95 ms", "p99 ms"))
+        stats = iface.get_stats()
+        cache = stats.pop("polkit.cache", {})
+        for key, values in sorted(stats.items()):
+            print(("{0:30s} {1:7.0f} {2:7.0f} " +
+                   "{3:9.2f} {4:9.2f} {5:9.2f}").format(
+                       key, values["count"], values["errors"],
+                       1000 * values["p50"], 1000 * values["p95"],
+                       1000 * values["p99"]))
+        print("Polkit cache: {0:.0f} hits, {1:.0f} misses".format(
+            cache.get("hits", 0), cache.get("misses", 0)))
+
+    if result.energy:
+        print("{0:30s} {1:>9s} {2:>9s} {3:>9s} {4:>7s}".format(
+            "power/cpu", "hours", "battery h", "Wh", "W"))
+        for key, values in sorted(iface.get_energy().items()):
+            print("{0:30s} {1:9.2f} {2:9.2f} {3:9.2f} {4:7.2f}".format(
+                key, values["seconds"] / 3600, values["discharging"] / 3600,
+                values["wh"], values["watts"]))
+
 except dbus.DBusException as error:
     sys.exit(error)
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 # -*-coding: utf-8-*-
 
-"""Neptune script when battery state changes"""
+"""Neptune script when battery state changes
+
+pm-utils runs it on AC plug events, at boot and on resume. The daemon
+reads the adapter state and switches the profile itself, the call only
+starts it through D-Bus activation if it is not running and makes it
+check now.
+"""
 
 from __future__ import (division, absolute_import, unicode_literals,
                         print_function)
@@ -15,14 +21,6 @@ try:
     bus = dbus.SystemBus()
     remote_object = bus.get_object(neptune.DBUS_SERVICE, neptune.DBUS_PATH)
     iface = dbus.Interface(remote_object, neptune.DBUS_INTERFACE)
-
-    if len(sys.argv) == 2 and sys.argv[1] == "false":
-        iface.set_power("performance")
-        iface.emit_info("Power connected", "Now on performance mode")
-    elif len(sys.argv) == 2 and sys.argv[1] == "true":
-        iface.set_power("powersave")
-        iface.emit_info("Power disconnected", "Now on powersave mode")
-    else:
-        print("Usage: neptune <true/false>")
+    iface.supply_changed()
 except dbus.DBusException as error:
     sys.exit(error)
@@ -13,6 +13,7 @@ import neptune.server
 
 if __name__ == '__main__':
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    dbus.mainloop.glib.threads_init()
 
     bus = dbus.SystemBus()
     name = dbus.service.BusName(neptune.DBUS_SERVICE, bus)
@@ -7,14 +7,13 @@ from __future__ import (division, absolute_import, unicode_literals,
                         print_function)
 
 import os
-# Since these modules depend on the above variable, load after
-from .system import System
-from .local import Local
 
-# do not import gtk by default
-# from . indicator import Indicator
-
-from . import tools
+# submodules are imported on first use, see __getattr__
+# (do not import gtk by default, use neptune.indicator explicitly)
+LAZY = {
+    "System": ("system", "System"),
+    "Local": ("local", "Local"),
+    "tools": ("tools", None)}
 
 
 DBUS_SERVICE = "org.neptune.Service"
@@ -25,23 +24,28 @@ DBUS_PATH = "/Control"
 ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
 ICON = os.path.join(ROOT, "icons", "neptune.svg")
 CONFIG_DIR = os.path.join(ROOT, "config")
+CACHE_DIR = "/var/cache/neptune"
+STATE_DIR = "/var/lib/neptune"
 
 BACKLIGHT_DIR = "/sys/class/backlight"
 BACKLIGHT_ORDER = ("acpi_video0",)
 CPU_DIR = "/sys/devices/system/cpu"
 SCREEN_OFF = "xset dpms force off"
+# number of threads writing the files of a profile switch
+WRITE_THREADS = 8
+# profile switches with fewer files are written in sequence
+WRITE_PARALLEL_MIN = 64
 
+POWER_SUPPLY_DIR = "/sys/class/power_supply"
+# power profiles applied by the daemon when the AC adapter is plugged
+# and unplugged, after SUPPLY_DEBOUNCE seconds of a stable state and at
+# most once every SUPPLY_HOLDOFF seconds
+POWER_AC = "performance"
+POWER_BATTERY = "powersave"
+SUPPLY_DEBOUNCE = 3
+SUPPLY_HOLDOFF = 30
+# used when there are no batteries in POWER_SUPPLY_DIR
 BATTERIES = {
-    "/sys/class/power_supply/BAT0/uevent": {
-        "POWER_SUPPLY_CHARGE_NOW": "capacity",
-        "POWER_SUPPLY_CURRENT_NOW": "rate",
-        "POWER_SUPPLY_VOLTAGE_NOW": "voltage",
-        "POWER_SUPPLY_STATUS": "state"},
-    "/sys/class/power_supply/BAT1/uevent": {
-        "POWER_SUPPLY_CHARGE_NOW": "capacity",
-        "POWER_SUPPLY_CURRENT_NOW": "rate",
-        "POWER_SUPPLY_VOLTAGE_NOW": "voltage",
-        "POWER_SUPPLY_STATUS": "state"},
     "/proc/acpi/battery/BAT0/state": {
         "present rate": "rate",
         "remaining capacity": "capacity",
@@ -56,6 +60,13 @@ NAME = "Neptune Indicator"
 VERSION = "0.2"
 DESCRIPTION = """Control the power consumption, brightness and input devices"""
 
+# prefix of the /sys, /proc, configuration, cache and state paths,
+# see set_root
+SYSFS_ROOT = ""
+ROOTED = ("CONFIG_DIR", "CACHE_DIR", "STATE_DIR", "BACKLIGHT_DIR", "CPU_DIR",
+          "POWER_SUPPLY_DIR", "BATTERIES", "BATTERY_INFO")
+UNROOTED = {}
+
 APP_DIR = "/usr/share/applications"
 AUTOSTART_DIR = os.path.join(os.path.expanduser("~"), ".config", "autostart")
 
@@ -68,3 +79,37 @@ class Error(Exception):
 
     def __str__(self):
         return self.value
+
+
+def set_root(root):
+    """Put all ROOTED paths and the kernel.ini files under root,
+    e.g. to run on a synthetic tree, "" is the real system"""
+    module = globals()
+    if not UNROOTED:
+        UNROOTED.update((name, module[name]) for name in ROOTED)
+    for name in ROOTED:
+        if isinstance(UNROOTED[name], dict):
+            module[name] = dict((root + path, value) for path, value
+                                in UNROOTED[name].items())
+        else:
+            module[name] = root + UNROOTED[name]
+    module["SYSFS_ROOT"] = root
+
+
+if os.environ.get("NEPTUNE_ROOT"):
+    set_root(os.environ["NEPTUNE_ROOT"])
+
+
+def __getattr__(name):
+    """Import the lazy submodules and classes on first use"""
+    if name not in LAZY:
+        raise AttributeError("module {0} has no attribute {1}".format(
+            __name__, name))
+    import importlib
+
+    module_name, attr = LAZY[name]
+    value = importlib.import_module("." + module_name, __name__)
+    if attr is not None:
+        value = getattr(value, attr)
+    globals()[name] = value
+    return value
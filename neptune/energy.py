@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Energy used per power profile and CPU governor"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import threading
+
+# longer gaps between samples (suspend, stopped daemon) are not counted
+MAX_GAP = 60
+
+
+class EnergyAccount(object):
+    """Integrate the battery power over time per (power, cpu) state
+
+    Each sample closes the interval since the previous one and charges
+    it to the state of the previous sample: the time always, the energy
+    only while discharging, when the battery power is the power used by
+    the system.
+    """
+
+    def __init__(self, max_gap=MAX_GAP):
+        self.max_gap = max_gap
+        self.lock = threading.Lock()
+        # {"power/cpu": [seconds, discharging seconds, Wh]}
+        self.totals = {}
+        self.last = None
+
+    def add(self, timestamp, power, cpu, battery):
+        """Add a sample of the state and of the battery reading"""
+        key = "{0}/{1}".format(power, cpu)
+        watts = (battery.get("watts", 0)
+                 if battery.get("state") == "discharging" else None)
+        with self.lock:
+            if self.last is not None:
+                last_timestamp, last_key, last_watts = self.last
+                seconds = timestamp - last_timestamp
+                if 0 < seconds <= self.max_gap:
+                    totals = self.totals.setdefault(last_key, [0.0, 0.0, 0.0])
+                    totals[0] += seconds
+                    if last_watts is not None:
+                        totals[1] += seconds
+                        totals[2] += last_watts * seconds / 3600
+            self.last = (timestamp, key, watts)
+
+    def get(self):
+        """Return {"power/cpu": {seconds, discharging, wh, watts}},
+        watts is the mean power while discharging"""
+        with self.lock:
+            return dict(
+                (key, {"seconds": seconds, "discharging": discharging,
+                       "wh": energy,
+                       "watts": (energy * 3600 / discharging
+                                 if discharging > 0 else 0.0)})
+                for key, (seconds, discharging, energy)
+                in self.totals.items())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Smoothed battery time-left estimate"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import math
+
+# seconds after which an old rate sample weighs half
+HALFLIFE = 120
+
+
+class TimeLeftEstimator(object):
+    """Exponentially weighted discharge rate
+
+    Every sample updates the mean and variance of the rate in O(1),
+    weighted by the time since the previous sample, so irregular polling
+    does not bias the estimate.
+    """
+
+    def __init__(self, halflife=HALFLIFE):
+        self.halflife = halflife
+        self.rate = None
+        self.variance = 0.0
+        self.first = None
+        self.last = None
+
+    def reset(self):
+        """Forget the samples, e.g. when the battery starts charging"""
+        self.rate = None
+        self.variance = 0.0
+        self.first = None
+        self.last = None
+
+    def add(self, timestamp, rate):
+        """Add a discharge rate sample"""
+        if rate <= 0:
+            return
+        if self.rate is None:
+            self.rate = float(rate)
+            self.first = timestamp
+        else:
+            alpha = 1 - 0.5 ** (max(0, timestamp - self.last) /
+                                self.halflife)
+            diff = rate - self.rate
+            self.rate += alpha * diff
+            self.variance = (1 - alpha) * (self.variance +
+                                           alpha * diff * diff)
+        self.last = timestamp
+
+    def estimate(self, capacity):
+        """Return (timeleft in hours, confidence between 0 and 1)
+        for the remaining capacity, None if there are no samples"""
+        if self.rate is None:
+            return None
+        # little history or a noisy rate lower the confidence
+        warmup = 1 - 0.5 ** ((self.last - self.first) / self.halflife)
+        spread = min(1, math.sqrt(self.variance) / self.rate)
+        return max(0, capacity) / self.rate, warmup * (1 - spread)
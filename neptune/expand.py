@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Expand the glob patterns of kernel.ini, with an on-disk cache"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import os
+import re
+import json
+import zlib
+import fnmatch
+
+MAGIC = re.compile(r"[*?[]")
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+
+def compile_pattern(pattern):
+    """Compile a glob pattern into an expansion plan
+
+    The plan is a list of steps, ("literal", path) joins a fixed path
+    and ("match", regex) lists a directory and keeps matching entries.
+    """
+    plan = []
+    literal = []
+    for part in pattern.split("/"):
+        if MAGIC.search(part):
+            if literal:
+                plan.append(("literal", "/".join(literal)))
+                literal = []
+            plan.append(("match", re.compile(fnmatch.translate(part))))
+        else:
+            literal.append(part)
+    if literal:
+        plan.append(("literal", "/".join(literal)))
+    return plan
+
+
+def expand_plan(plan, scanned=None):
+    """Return the existing files of a plan, the listed directories are
+    added to the scanned set, also the missing ones so the cache notices
+    when they appear"""
+    paths = [""]
+    for step, value in plan:
+        if step == "literal":
+            paths = [path + "/" + value if path else value
+                     for path in paths]
+        else:
+            matches = []
+            for path in paths:
+                dirname = path or "/"
+                if scanned is not None:
+                    scanned.add(dirname)
+                try:
+                    entries = sorted(os.listdir(dirname))
+                except OSError:
+                    continue
+                matches.extend(os.path.join(dirname, entry)
+                               for entry in entries
+                               if value.match(entry)
+                               and not entry.startswith("."))
+            paths = matches
+    return [path for path in paths if os.path.exists(path)]
+
+
+def fingerprint(dirnames):
+    """Cheap fingerprint of directories: mtime, number of links, number
+    of entries and a crc of the sorted entry names
+
+    sysfs does not update the mtime of a directory when a device is
+    hotplugged, so the entries themselves are compared. Listing them is
+    cheap, the costly part of the expansion is testing every file.
+    """
+    result = {}
+    for dirname in dirnames:
+        try:
+            stat = os.stat(dirname)
+            entries = sorted(os.listdir(dirname))
+            result[dirname] = [
+                stat.st_mtime, stat.st_nlink, len(entries),
+                zlib.crc32("/".join(entries).encode("utf-8",
+                                                    "surrogateescape"))]
+        except OSError:
+            result[dirname] = None
+    return result
+
+
+def boot_id():
+    """Identifier of the current boot, the hardware may differ
+    between boots"""
+    try:
+        with open(BOOT_ID, "r") as fobj:
+            return fobj.read().strip()
+    except IOError:
+        return ""
+
+
+def expand(patterns, config_fname, cache_fname=None):
+    """Return {pattern: [files]}
+
+    When cache_fname is given, the result is stored there, keyed by the
+    mtime of config_fname, the boot and a fingerprint of the scanned
+    directories, and reused while those did not change.
+    """
+    try:
+        config_mtime = os.stat(config_fname).st_mtime
+    except OSError:
+        config_mtime = None
+
+    if cache_fname:
+        try:
+            with open(cache_fname, "r") as fobj:
+                cache = json.load(fobj)
+            if (cache["config"] == config_mtime and
+                    cache["boot"] == boot_id() and
+                    sorted(cache["patterns"]) == sorted(patterns) and
+                    cache["fingerprint"] == fingerprint(
+                        cache["fingerprint"].keys())):
+                return cache["patterns"]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
+    scanned = set()
+    expanded = dict((pattern, expand_plan(compile_pattern(pattern), scanned))
+                    for pattern in patterns)
+
+    if cache_fname:
+        try:
+            if not os.path.exists(os.path.dirname(cache_fname)):
+                os.makedirs(os.path.dirname(cache_fname))
+            with open(cache_fname, "w") as fobj:
+                json.dump({"config": config_mtime,
+                           "boot": boot_id(),
+                           "fingerprint": fingerprint(scanned),
+                           "patterns": expanded}, fobj)
+        except (IOError, OSError):
+            pass
+    return expanded
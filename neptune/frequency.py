@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Sampling of the current CPU frequencies"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import array
+
+from .sysfs import SysfsReader
+
+# samples combined into one min/mean/max window
+WINDOW = 60
+
+
+class FrequencySampler(object):
+    """Read scaling_cur_freq of every cpufreq policy into preallocated
+    arrays
+
+    The files stay open in a SysfsReader and are parsed in its shared
+    buffer, the values go into fixed arrays of doubles. Every WINDOW
+    samples the minimum, mean and maximum of the window are published
+    and the accumulators start over.
+    """
+
+    def __init__(self, paths, window=WINDOW):
+        self.paths = list(paths)
+        self.window = window
+        size = len(self.paths)
+        self.reader = SysfsReader()
+        for path in self.paths:
+            self.reader.add(path)
+        self.timestamp = 0.0
+        self.latest = array.array("d", [0.0]) * size
+        # accumulators of the current window
+        self.count = 0
+        self.mins = array.array("d", [0.0]) * size
+        self.sums = array.array("d", [0.0]) * size
+        self.maxs = array.array("d", [0.0]) * size
+        # the last complete window, min, mean and max
+        self.window_count = 0
+        self.window_min = array.array("d", [0.0]) * size
+        self.window_mean = array.array("d", [0.0]) * size
+        self.window_max = array.array("d", [0.0]) * size
+
+    def close(self):
+        """Close all descriptors"""
+        self.reader.close()
+
+    def read(self, index):
+        """Return the frequency of policy index in kHz, 0 if
+        unreadable"""
+        try:
+            return self.reader.read_int(self.paths[index])
+        except (IOError, ValueError):
+            # policy without online CPU
+            return 0
+
+    def sample(self, timestamp):
+        """Read all CPUs and add them to the window"""
+        first = self.count == 0
+        for index in range(len(self.paths)):
+            value = self.read(index)
+            self.latest[index] = value
+            if first:
+                self.mins[index] = value
+                self.maxs[index] = value
+                self.sums[index] = value
+            else:
+                if value < self.mins[index]:
+                    self.mins[index] = value
+                if value > self.maxs[index]:
+                    self.maxs[index] = value
+                self.sums[index] += value
+        self.timestamp = timestamp
+        self.count += 1
+        if self.count >= self.window:
+            self.publish()
+
+    def publish(self, reset=True):
+        """Copy the statistics of the current window, and start a new
+        window if reset"""
+        for index in range(len(self.paths)):
+            self.window_min[index] = self.mins[index]
+            self.window_mean[index] = self.sums[index] / self.count
+            self.window_max[index] = self.maxs[index]
+        if reset:
+            self.window_count = self.count
+            self.count = 0
+
+    def get(self):
+        """Return (timestamp, latest, min, mean, max) in kHz, the
+        statistics of the last complete window or of the current one
+        before the first window is complete"""
+        if self.window_count == 0 and self.count > 0:
+            self.publish(False)
+        return (self.timestamp, self.latest, self.window_min,
+                self.window_mean, self.window_max)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Fixed-size battery history"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import array
+
+# one day of samples at the server's watch interval
+HISTORY_SIZE = 17280
+FIELDS = ("timestamp", "rate", "voltage", "capacity")
+STATES = ("unknown", "charging", "discharging", "full", "not charging")
+
+
+class BatteryHistory(object):
+    """Ring buffer of (timestamp, rate, voltage, capacity, state) samples
+
+    The samples live in preallocated arrays, so the memory use is fixed
+    at about 33 bytes per sample and appending is O(1). The oldest
+    sample is overwritten when the buffer is full. The samples are kept
+    in timestamp order for query, a sample older than the newest one,
+    after the clock was set back, is dropped.
+    """
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self.values = array.array("d", [0.0]) * (size * len(FIELDS))
+        self.states = array.array("B", [0]) * size
+        self.view = memoryview(self.values)
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, rate, voltage, capacity, state):
+        """Add a sample, overwriting the oldest when full, return
+        whether it was added"""
+        if self.count and timestamp < self.timestamp(self.count - 1):
+            return False
+        if self.count < self.size:
+            index = (self.start + self.count) % self.size
+            self.count += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.size
+        offset = index * len(FIELDS)
+        self.values[offset] = timestamp
+        self.values[offset + 1] = rate
+        self.values[offset + 2] = voltage
+        self.values[offset + 3] = capacity
+        self.states[index] = (STATES.index(state) if state in STATES
+                              else 0)
+        return True
+
+    def timestamp(self, position):
+        """Timestamp of the sample at position, 0 is the oldest"""
+        return self.values[((self.start + position) % self.size) *
+                           len(FIELDS)]
+
+    def bisect(self, timestamp):
+        """First position with a timestamp >= timestamp"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start=0, end=None):
+        """Samples with start <= timestamp < end, oldest first"""
+        first = self.bisect(start)
+        last = self.count if end is None else self.bisect(end)
+        samples = []
+        for position in range(first, last):
+            index = (self.start + position) % self.size
+            offset = index * len(FIELDS)
+            samples.append(
+                tuple(self.view[offset:offset + len(FIELDS)].tolist()) +
+                (STATES[self.states[index]],))
+        return samples
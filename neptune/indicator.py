@@ -9,6 +9,7 @@ from __future__ import (division, absolute_import, unicode_literals,
 import dbus
 
 from gi.repository import Gtk
+from gi.repository import GLib
 from gi.repository import GdkPixbuf
 from gi.repository import Notify
 from gi.repository import AppIndicator3
@@ -18,8 +19,11 @@ from gi.repository import AppIndicator3
 # fix_gtk()
 
 import neptune
+import neptune.xinput
 
 MIN_BRIGHTNESS = 10
+# milliseconds during which scroll events are added up
+SCROLL_INTERVAL = 40
 
 
 class Indicator(object):
@@ -31,11 +35,20 @@ class Indicator(object):
             AppIndicator3.IndicatorCategory.HARDWARE)
         self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
         self.indicator.connect("scroll-event", self.scroll)
+        self.scroll_change = 0
+        self.scroll_timer = None
 
         Notify.init("Neptune")
 
         self.local = neptune.Local()
+        xinput_fd = self.local.start_xinput_events()
+        if xinput_fd is not None:
+            GLib.io_add_watch(xinput_fd, GLib.PRIORITY_DEFAULT, GLib.IO_IN,
+                              self.xinput_events)
         self.iface = None
+        self.state = {}
+        self.owner = None
+        self.owner_watch = None
         self.dbus_connect()
 
         menu = Gtk.Menu()
@@ -96,6 +109,26 @@ class Indicator(object):
                 else:
                     return default
 
+    def get_state(self):
+        """Get brightness, power, cpu and battery from the local cache,
+        which is kept up to date by the state_changed signal"""
+        if not self.state:
+            self.state = dict(self.dbus_exec("get_state", (), {}))
+        return self.state
+
+    def state_changed(self, changed):
+        """The server state changed"""
+        changed = dict(changed)
+        for key in changed.pop("removed", []):
+            self.state.pop(key, None)
+        self.state.update(changed)
+
+    def name_owner_changed(self, owner):
+        """A (new) server started, refresh the whole state"""
+        if owner != self.owner:
+            self.owner = owner
+            self.state = {}
+
     def dbus_connect(self):
         """Connect to dbus"""
         try:
@@ -104,7 +137,13 @@ class Indicator(object):
                                            neptune.DBUS_PATH)
             self.iface = dbus.Interface(remote_object, neptune.DBUS_INTERFACE)
             self.iface.connect_to_signal("info", self.info)
+            self.iface.connect_to_signal("state_changed", self.state_changed)
             self.iface.test()
+            self.state = dict(self.iface.get_state())
+            self.owner = bus.get_name_owner(neptune.DBUS_SERVICE)
+            if self.owner_watch is None:
+                self.owner_watch = bus.watch_name_owner(
+                    neptune.DBUS_SERVICE, self.name_owner_changed)
         except dbus.DBusException as error:
             dialog = Gtk.MessageDialog(
                 buttons=Gtk.ButtonsType.CLOSE,
@@ -114,6 +153,11 @@ class Indicator(object):
             dialog.run()
             dialog.destroy()
 
+    def xinput_events(self, _fd, _condition):
+        """Input devices changed, stop watching once the X connection
+        failed"""
+        return self.local.process_xinput_events()
+
     @staticmethod
     def info(title, message):
         """Notification"""
@@ -121,11 +165,25 @@ class Indicator(object):
         notification.show()
 
     def scroll(self, _widget, _mouse, direction):
-        """Scrolled on menu"""
+        """Scrolled on menu, collect the changes until the next flush"""
         if direction == 0:  # scroll up
-            self.dbus_exec("update_brightness", (+1, "default"))
+            self.scroll_change += 1
         elif direction == 1:  # scroll down
-            self.dbus_exec("update_brightness", (-1, "default"))
+            self.scroll_change -= 1
+        if self.scroll_timer is None:
+            self.scroll_timer = GLib.timeout_add(SCROLL_INTERVAL,
+                                                 self.scroll_flush)
+
+    def scroll_flush(self):
+        """Send the collected scroll changes in one asynchronous call"""
+        self.scroll_timer = None
+        change, self.scroll_change = self.scroll_change, 0
+        if change != 0 and self.iface is not None:
+            self.iface.update_brightness(
+                change, "default",
+                reply_handler=lambda: None,
+                error_handler=lambda error: print(error))
+        return False
 
     @staticmethod
     def quit(_widget):
@@ -158,13 +216,13 @@ class BrightnessMenu(Gtk.Menu):
         self.backlight = backlight
 
         reference = None
-        max_brightness = self.main.dbus_exec("get_max_brightness",
-                                             (backlight,), [])
-        min_brightness = self.main.dbus_exec("get_min_brightness",
-                                             (backlight,), [])
+        limits = self.main.get_state().get("backlight", {}).get(
+            backlight, {"min": 0, "max": 0})
+        max_brightness = limits["max"]
+        min_brightness = limits["min"]
         for brightness in (
                 list(range(min_brightness, max_brightness,
-                           int((max_brightness - min_brightness) / 10))) +
+                           max(1, (max_brightness - min_brightness) // 10))) +
                 [max_brightness]):
             item = Gtk.RadioMenuItem(group=reference, label=brightness)
             item.brightness = brightness
@@ -177,8 +235,8 @@ class BrightnessMenu(Gtk.Menu):
 
     def update(self, _widget):
         """Update menu to pre-select brightness brightness"""
-        brightness = self.main.dbus_exec("get_brightness", (self.backlight,),
-                                         None)
+        brightness = self.main.get_state().get("brightness", {}).get(
+            self.backlight)
         for item in self.get_children():
             if hasattr(item, "brightness") and item.brightness == brightness:
                 item.set_active(True)
@@ -197,12 +255,10 @@ class ScreenMenu(Gtk.Menu):
         super(ScreenMenu, self).__init__()
         self.main = main
 
-        backlights = main.dbus_exec("get_backlights", [])
+        backlights = main.get_state().get("backlight", {})
         if len(backlights) > 0:
-            self.max_brightness = main.dbus_exec("get_max_brightness",
-                                                 ("default",), [])
-            self.min_brightness = main.dbus_exec("get_min_brightness",
-                                                 ("default",), [])
+            self.max_brightness = backlights["default"]["max"]
+            self.min_brightness = backlights["default"]["min"]
 
             reference = None
             item = Gtk.RadioMenuItem(
@@ -238,7 +294,6 @@ class ScreenMenu(Gtk.Menu):
         self.append(item)
         item.show()
 
-        backlights = main.dbus_exec("get_backlights", [])
         if len(backlights) > 0:
             item = Gtk.MenuItem(label="Brightness")
             item.set_submenu(BrightnessMenu(main, "default"))
@@ -263,7 +318,8 @@ class ScreenMenu(Gtk.Menu):
 
     def update(self, _widget):
         """Update menu to pre-select brightness brightness"""
-        brightness = self.main.dbus_exec("get_brightness", ("default",), None)
+        brightness = self.main.get_state().get("brightness", {}).get(
+            "default")
         for item in self.get_children():
             if hasattr(item, "screen") and item.screen == brightness:
                 item.set_active(True)
@@ -365,13 +421,12 @@ class PowerMenu(Gtk.Menu):
 
     def update(self, _widget):
         """Update the power menu"""
+        state = self.main.get_state()
+        self.update_power(state.get("power"))
+        self.update_battery(state.get("battery", {}))
 
-        self.update_power()
-        self.update_battery()
-
-    def update_battery(self):
+    def update_battery(self, battery):
         """Update battery status in the menu"""
-        battery = self.main.dbus_exec("get_battery", (), {})
         for item in self.get_children():
             if hasattr(item, "capacity"):
                 if "capacity" in battery:
@@ -386,10 +441,9 @@ class PowerMenu(Gtk.Menu):
                             item.set_label(
                                 ("Power: {watt:.1f} W" +
                                  " ({hour:d}:{mins:02d} hours)").format(
-                                     watt=float(battery["watts"]),
-                                     hour=int(float(battery["timeleft"]) // 1),
-                                     mins=int(
-                                         60 * float(battery["timeleft"]) % 1)))
+                                     watt=battery["watts"],
+                                     hour=int(battery["timeleft"] // 1),
+                                     mins=int(60 * (battery["timeleft"] % 1))))
                         else:
                             item.set_label("On battery")
                     else:
@@ -397,9 +451,8 @@ class PowerMenu(Gtk.Menu):
                 else:
                     item.hide()
 
-    def update_power(self):
+    def update_power(self, power):
         """Update power status in the menu"""
-        power = self.main.dbus_exec("get_power", (), None)
         for item in self.get_children():
             if hasattr(item, "power") and item.power == power:
                 item.set_active(True)
@@ -439,7 +492,7 @@ class CpuMenu(Gtk.Menu):
 
     def update(self, widget):
         """Update menu to pre-select current cpu governor"""
-        cpu = self.main.dbus_exec("get_cpu", (), None)
+        cpu = self.main.get_state().get("cpu")
         for item in widget.get_children():
             if item.cpu == cpu:
                 item.set_active(True)
@@ -475,8 +528,40 @@ class XSlaveMenu(Gtk.Menu):
         super(XSlaveMenu, self).__init__()
         self.main = main
         self.master_id = master_id
-
-        self.connect("show", self.update)
+        self.items = {}
+
+        if main.local.devices is not None:
+            # the device table follows X events, apply only its changes
+            main.local.add_xinput_listener(self.apply)
+            self.apply([("add", device) for device in sorted(
+                main.local.devices.values(),
+                key=lambda device: int(device[1]))])
+        else:
+            self.connect("show", self.update)
+
+    def apply(self, changes):
+        """Apply the changes of the device table to the menu"""
+        for action, (xname, xid, use, attachment, xenabled) in changes:
+            slave = (action != "remove" and
+                     use in neptune.xinput.SLAVES and
+                     attachment == self.master_id and
+                     "Virtual" not in xname)
+            if not slave:
+                if xid in self.items:
+                    self.items.pop(xid).destroy()
+            elif xid not in self.items:
+                item = Gtk.CheckMenuItem(
+                    label="{xname} ({xid})".format(xname=xname, xid=xid))
+                item.set_active(xenabled)
+                item.handler = item.connect("activate", self.set_xinput, xid)
+                item.show()
+                self.append(item)
+                self.items[xid] = item
+            elif self.items[xid].get_active() != xenabled:
+                item = self.items[xid]
+                item.handler_block(item.handler)
+                item.set_active(xenabled)
+                item.handler_unblock(item.handler)
 
     def update(self, _widget):
         """Fill the xslave menu"""
@@ -14,6 +14,7 @@ import logging
 import neptune
 
 from . import tools
+from .xinput import XInput, MASTERS, SLAVES
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +23,83 @@ class Local(object):
     """All control commands"""
 
     def __init__(self):
-        pass
+        self.xinput = None
+        self.xinput_tried = False
+        # device table kept up to date by process_xinput_events
+        self.devices = None
+        self.xinput_listeners = []
+
+    def get_xinput_backend(self):
+        """The XInput backend, None to use the xinput command"""
+        if not self.xinput_tried:
+            self.xinput_tried = True
+            try:
+                self.xinput = XInput()
+            except neptune.Error as error:
+                logger.info("Using the xinput command: %s", error)
+        return self.xinput
+
+    def get_xinput_devices(self):
+        """Return [(name, id, use, attachment, enabled)] of all devices
+        through the backend, None if it is not available"""
+        backend = self.get_xinput_backend()
+        if backend is None:
+            return None
+        try:
+            return backend.get_devices()
+        except neptune.Error as error:
+            logger.error(error)
+            self.xinput = None
+            return None
+
+    def start_xinput_events(self):
+        """Track device changes through X events, return the file
+        descriptor on which process_xinput_events has to be called,
+        None if devices can only be listed with the xinput command"""
+        backend = self.get_xinput_backend()
+        devices = self.get_xinput_devices()
+        if backend is None or devices is None:
+            return None
+        self.devices = dict((device[1], device) for device in devices)
+        return backend.select_events()
+
+    def add_xinput_listener(self, listener):
+        """Call listener(changes) with [(action, device)] for every change
+        of the device table, action is "add", "remove" or "change" and
+        device is (name, id, use, attachment, enabled)"""
+        self.xinput_listeners.append(listener)
+
+    def process_xinput_events(self):
+        """Update the device table from the pending X events, return
+        False once the X connection failed and the xinput command is
+        used instead"""
+        # requests may queue new events, so read until none are left
+        while self.xinput is not None:
+            try:
+                if not self.xinput.read_events():
+                    return True
+            except neptune.Error as error:
+                logger.error(error)
+                self.xinput = None
+                break
+            devices = self.get_xinput_devices()
+            if devices is None:
+                break
+
+            devices = dict((device[1], device) for device in devices)
+            changes = (
+                [("remove", self.devices[xid]) for xid in self.devices
+                 if xid not in devices] +
+                [("add", devices[xid]) for xid in devices
+                 if xid not in self.devices] +
+                [("change", devices[xid]) for xid in devices
+                 if xid in self.devices and
+                 devices[xid] != self.devices[xid]])
+            self.devices = devices
+            if changes:
+                for listener in self.xinput_listeners:
+                    listener(changes)
+        return False
 
     @staticmethod
     def screen_off():
@@ -31,18 +108,28 @@ class Local(object):
             subprocess.check_call(neptune.SCREEN_OFF, shell=True)
         except subprocess.CalledProcessError as error:
             logger.error(error)
-            logger.error(tools.to_unicode(error.output))
+            logger.error(tools.to_unicode(error.output, neptune.SCREEN_OFF))
 
     def get_xinput_list(self, master_id=""):
         """Get all xinput devices"""
+        devices = self.get_xinput_devices()
+        if devices is not None:
+            for xlabel, xid, use, attachment, enabled in devices:
+                if master_id == "" and use in MASTERS:
+                    yield xlabel, xid, enabled
+                elif use in SLAVES and attachment == master_id \
+                        and master_id != "":
+                    yield xlabel, xid, enabled
+            return
+
         current_master = ""
         try:
             output = subprocess.check_output("xinput list", shell=True)
         except subprocess.CalledProcessError as error:
             logger.error(error)
-            logger.error(tools.to_unicode(error.output))
+            logger.error(tools.to_unicode(error.output, "xinput list"))
             return
-        output = tools.to_unicode(output)
+        output = tools.to_unicode(output, "xinput list")
 
         for line in output.split("\n"):
             result = re.match(r".*[\u21b3\u23a1\u23a3](.*)id=(\d+).*\[(.*)\]",
@@ -66,9 +153,9 @@ class Local(object):
                 shell=True)
         except subprocess.CalledProcessError as error:
             logger.error(error)
-            logger.error(tools.to_unicode(error.output))
+            logger.error(tools.to_unicode(error.output, "xinput --list-props"))
             return False
-        output = tools.to_unicode(output)
+        output = tools.to_unicode(output, "xinput --list-props")
 
         for line in output.split("\n"):
             result = pattern.match(line)
@@ -78,6 +165,13 @@ class Local(object):
 
     def set_xinput_enabled(self, xid, enabled):
         """Enable or disable the device"""
+        if self.get_xinput_backend() is not None:
+            try:
+                self.xinput.set_enabled(xid, enabled)
+                return
+            except neptune.Error as error:
+                logger.error(error)
+                self.xinput = None
         if enabled != self._get_xinput_enabled(xid):
             cmd = "xinput set-prop {xid} 'Device Enabled' {enabled:d}".format(
                 xid=xid, enabled=enabled)
@@ -85,7 +179,8 @@ class Local(object):
                 subprocess.check_call(cmd, shell=True)
             except subprocess.CalledProcessError as error:
                 logger.error(error)
-                logger.error(tools.to_unicode(error.output))
+                logger.error(tools.to_unicode(error.output,
+                                              "xinput set-prop"))
 
     @staticmethod
     def get_autostart():
@@ -6,12 +6,19 @@
 from __future__ import (division, absolute_import, unicode_literals,
                         print_function)
 
+import threading
+import time
+
 from gi.repository import GObject
 import dbus
 import dbus.service
 import dbus.mainloop.glib
 
 
+# seconds a positive authorization is remembered
+AUTH_TTL = 60
+
+
 class PermissionDeniedByPolicy(dbus.DBusException):
     """Exception when policykit denies"""
     _dbus_error_name = 'com.ubuntu.DeviceDriver.PermissionDeniedByPolicy'
@@ -31,10 +38,23 @@ class PolkitDBus(dbus.service.Object):
                             '/org/freedesktop/DBus/Bus', False),
             'org.freedesktop.DBus')
 
+        # authorization cache, used by check_polkit
+        self.auth_ttl = AUTH_TTL
+        self.auth_cache = {}
+        self.auth_processes = {}
+        self.auth_stats = {"hits": 0, "misses": 0}
+        conn.add_signal_receiver(
+            self.name_owner_changed,
+            signal_name="NameOwnerChanged",
+            dbus_interface="org.freedesktop.DBus",
+            bus_name="org.freedesktop.DBus",
+            path="/org/freedesktop/DBus")
+
         self.mainloop = None
 
     def start(self):
         """Start a mainloop"""
+        GObject.threads_init()
         self.mainloop = GObject.MainLoop()
         self.mainloop.run()
 
@@ -43,6 +63,31 @@ class PolkitDBus(dbus.service.Object):
         if self.mainloop:
             self.mainloop.quit()
 
+    @staticmethod
+    def run_in_thread(function, args, reply_handler, error_handler):
+        """Run a blocking function outside the mainloop, and reply
+        through the async_callbacks of a dbus.service.method"""
+
+        def reply(result):
+            """Send the reply from the mainloop"""
+            if result is None:
+                reply_handler()
+            else:
+                reply_handler(result)
+
+        def target():
+            """Thread target"""
+            try:
+                result = function(*args)
+            except Exception as error:  # (catch all) pylint: disable=W0703
+                GObject.idle_add(error_handler, error)
+            else:
+                GObject.idle_add(reply, result)
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+
     def check_polkit(self, sender, privilege):
         """Verify that sender has a given PolicyKit privilege.
         sender: sender's (private) D-BUS name, such as ":1:42"
@@ -56,8 +101,18 @@ class PolkitDBus(dbus.service.Object):
             # called locally, not through D-BUS
             return
 
-        # get peer PID
-        pid = self.dbus_info.GetConnectionUnixProcessID(sender)
+        # get peer PID and start time, fixed for the lifetime of sender
+        if sender not in self.auth_processes:
+            pid = self.dbus_info.GetConnectionUnixProcessID(sender)
+            self.auth_processes[sender] = (pid, self.get_start_time(pid))
+        pid, start_time = self.auth_processes[sender]
+
+        key = (sender, start_time, privilege)
+        if self.auth_cache.get(key, 0) > time.time():
+            self.auth_stats["hits"] += 1
+            return
+        self.auth_stats["misses"] += 1
+        self.auth_cache.pop(key, None)
 
         # query PolicyKit
         if self.polkit is None:
@@ -74,10 +129,11 @@ class PolkitDBus(dbus.service.Object):
             (is_auth, _, _details) = self.polkit.CheckAuthorization(
                 ('unix-process', {
                     'pid': dbus.UInt32(pid, variant_level=1),
-                    'start-time': dbus.UInt64(0, variant_level=1)}),
+                    'start-time': dbus.UInt64(start_time,
+                                              variant_level=1)}),
                 privilege, {'': ''}, dbus.UInt32(1), '', timeout=600)
         except dbus.DBusException as error:
-            if error.get_dbus_name \
+            if error.get_dbus_name() \
                     == 'org.freedesktop.DBus.Error.ServiceUnknown':
                 # polkitd timed out, connect again
                 self.polkit = None
@@ -87,3 +143,24 @@ class PolkitDBus(dbus.service.Object):
 
         if not is_auth:
             raise PermissionDeniedByPolicy(privilege)
+        self.auth_cache[key] = time.time() + self.auth_ttl
+
+    def name_owner_changed(self, name, _old_owner, new_owner):
+        """Forget the authorizations of senders that left the bus"""
+        if new_owner == "" and name in self.auth_processes:
+            del self.auth_processes[name]
+            for key in list(self.auth_cache.keys()):
+                if key[0] == name:
+                    del self.auth_cache[key]
+
+    @staticmethod
+    def get_start_time(pid):
+        """Start time of process pid, as used by PolicyKit,
+        0 if unknown"""
+        try:
+            with open("/proc/{0}/stat".format(pid), "r") as fobj:
+                # the command name may contain spaces, skip it
+                fields = fobj.read().rsplit(")", 1)[1].split()
+            return int(fields[19])
+        except (IOError, IndexError, ValueError):
+            return 0
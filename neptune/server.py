@@ -6,12 +6,50 @@
 from __future__ import (division, absolute_import, unicode_literals,
                         print_function)
 
+import os
+import time
+import six
+from gi.repository import GObject, GLib
 import dbus
 import dbus.service
 import dbus.mainloop.glib
 
 import neptune
 from .polkit_dbus import PolkitDBus
+from .history import BatteryHistory
+from .stats import Stats
+from .frequency import FrequencySampler
+from .energy import EnergyAccount
+from .supply import SupplyWatch, UeventMonitor
+from .system import SETTINGS, STATE_KEYS, SUBSYSTEMS
+from . import telemetry
+
+# milliseconds during which update_brightness calls are combined
+BRIGHTNESS_WINDOW = 30
+# seconds between checks for changes made outside the daemon
+WATCH_INTERVAL = 5
+# seconds between re-reads of the cached kernel.ini files
+REVALIDATE_INTERVAL = 30
+# seconds between CPU frequency samples
+FREQUENCY_INTERVAL = 1
+
+
+def to_dbus(value):
+    """Convert nested dicts to typed a{sv} dictionaries"""
+    if isinstance(value, dict):
+        return dbus.Dictionary(
+            dict((key, to_dbus(val)) for key, val in value.items()),
+            signature="sv")
+    elif isinstance(value, (list, tuple)):
+        return dbus.Array([to_dbus(val) for val in value], signature="v")
+    elif isinstance(value, bool):
+        return dbus.Boolean(value)
+    elif isinstance(value, six.integer_types):
+        return dbus.Int64(value)
+    elif isinstance(value, float):
+        return dbus.Double(value)
+    return value
+
 
 # class GeneralException(dbus.DBusException):
 #     """General exception when error occurs"""
@@ -25,7 +63,268 @@ class ControlObject(PolkitDBus):
 
     def __init__(self, conn=None, object_path=None, bus_name=None):
         PolkitDBus.__init__(self, conn, object_path, bus_name)
-        self.system = neptune.System()
+        self.stats = Stats()
+        # discovery runs in the background, calls wait in System
+        # for the subsystem they use
+        self.system = neptune.System(deferred=True)
+        self.brightness_changes = {}
+        self.history = BatteryHistory()
+        self.energy = EnergyAccount()
+        self.telemetry = telemetry.open_store()
+        self.restore()
+        self.state = {}
+        self.frequencies = FrequencySampler([])
+        self.supply = SupplyWatch(neptune.SUPPLY_DEBOUNCE,
+                                  neptune.SUPPLY_HOLDOFF)
+        self.supply_timer = None
+        self.uevents = None
+        self.run_in_thread(self.discovered, (), self.start_watches,
+                           self.start_watches)
+
+    def discovered(self):
+        """Thread target waiting for the end of the discovery"""
+        for event in self.system.ready.values():
+            event.wait()
+
+    def start_watches(self, _error=None):
+        """Read the first state and start the periodic checks"""
+        self.state = self.system.get_state()
+        GObject.timeout_add_seconds(WATCH_INTERVAL, self.watch)
+        GObject.timeout_add_seconds(REVALIDATE_INTERVAL, self.revalidate)
+        self.frequencies = FrequencySampler(
+            os.path.join(path, "scaling_cur_freq")
+            for path in self.system.policies.values())
+        GObject.timeout_add_seconds(FREQUENCY_INTERVAL, self.sample)
+        if self.system.mains:
+            try:
+                self.uevents = UeventMonitor("power_supply")
+                GLib.io_add_watch(self.uevents.fileno(),
+                                  GLib.PRIORITY_DEFAULT, GLib.IO_IN,
+                                  self.supply_event)
+            except IOError as error:
+                # the power.d hook calls supply_changed
+                print(error)
+            self.check_supply()
+
+    @staticmethod
+    def _system_call(function, *args):
+        """Call a System method, raise errors as DBusException"""
+        try:
+            return function(*args)
+        except neptune.Error as error:
+            raise dbus.DBusException(error)
+
+    def authorize(self, method, sender, action="control"):
+        """Check the polkit action, timed as the auth phase of method"""
+        with self.stats.measure(method, "auth"):
+            self.check_polkit(sender, "{0}.{1}".format(
+                neptune.POLKIT_SERVICE, action))
+
+    def run_write(self, method, function, args, reply_handler,
+                  error_handler):
+        """Run a System method in a thread as the write phase of method,
+        the total phase ends with the reply"""
+        start = time.monotonic()
+
+        def write(*args):
+            """Thread target"""
+            with self.stats.measure(method, "write"):
+                return self._system_call(function, *args)
+
+        def reply(*result):
+            """Reply handler"""
+            reply_handler(*result)
+            self.stats.add(method, "total", time.monotonic() - start)
+
+        def error(exception):
+            """Error handler"""
+            self.stats.add(method, "total", time.monotonic() - start,
+                           True)
+            error_handler(exception)
+
+        self.run_in_thread(write, args, reply, error)
+
+    def when_ready(self, subsystems, function, reply_handler,
+                   error_handler):
+        """Call function in the main loop once subsystems are
+        discovered and reply with its result. Until then a thread
+        waits, so the main loop keeps serving the other calls."""
+        def call():
+            """Run function and reply"""
+            try:
+                result = function()
+            except Exception as error:  # (catch all) pylint: disable=W0703
+                error_handler(error)
+                return
+            if result is None:
+                reply_handler()
+            else:
+                reply_handler(result)
+
+        if all(self.system.ready[subsystem].is_set()
+               for subsystem in subsystems):
+            call()
+        else:
+            self.run_in_thread(self._system_call,
+                               (self.system.wait, ) + tuple(subsystems),
+                               call, error_handler)
+
+    def update_state(self, subsystems=SUBSYSTEMS):
+        """Re-read the keys of subsystems, emit state_changed with the
+        changed keys and return the whole state"""
+        state = self.system.get_state(subsystems)
+        changed = dict((key, value) for key, value in state.items()
+                       if self.state.get(key) != value)
+        removed = [key for subsystem in subsystems
+                   for key in STATE_KEYS[subsystem]
+                   if key in self.state and key not in state]
+        self.state = dict((key, value) for key, value in self.state.items()
+                          if key not in removed)
+        self.state.update(state)
+        if removed:
+            changed["removed"] = removed
+        if changed:
+            self.state_changed(to_dbus(changed))
+        return self.state
+
+    def watch(self):
+        """Periodically re-read the battery and record the battery
+        history and energy, the other keys are kept up to date by the
+        calls that write them and by the revalidation"""
+        with self.stats.measure("watch", "read"):
+            state = self.update_state(("battery", ))
+        battery = state["battery"]
+        self.energy.add(time.time(), state.get("power", "unknown"),
+                        state.get("cpu", "unknown"), battery)
+        if battery:
+            self.history.append(
+                time.time(), battery.get("rate", 0),
+                battery.get("voltage", 0), battery.get("capacity", 0),
+                battery.get("state", "unknown"))
+        if self.telemetry:
+            latest = self.frequencies.latest
+            self.telemetry.append(
+                time.time(), battery,
+                state.get("brightness", {}).get("default", 0),
+                state.get("power", "unknown"), state.get("cpu", "unknown"),
+                sum(latest) / len(latest) if latest else 0,
+                max(latest) if latest else 0)
+        return True
+
+    def restore(self):
+        """Fill the battery history and the energy account from the
+        telemetry of the previous runs"""
+        if not self.telemetry:
+            return
+        for record in self.telemetry.records():
+            battery = {"state": record["state"],
+                       "watts": (record["voltage"] / 1000 *
+                                 record["rate"] / 1000)}
+            self.energy.add(record["timestamp"], record["power"],
+                            record["cpu"], battery)
+            if record["state"] != "unknown" or record["capacity"]:
+                self.history.append(
+                    record["timestamp"], record["rate"], record["voltage"],
+                    record["capacity"], record["state"])
+
+    def revalidate(self):
+        """Periodically re-read the power files in a thread,
+        they can be changed by other programs"""
+        def reply(changed):
+            """Reply handler"""
+            if changed:
+                self.update_state(("power", ))
+
+        def error(exception):
+            """Error handler"""
+            print("Revalidating failed:", exception)
+
+        self.run_in_thread(self.system.revalidate_power, (), reply, error)
+        return True
+
+    def sample(self):
+        """Periodically sample the CPU frequencies"""
+        self.frequencies.sample(time.time())
+        return True
+
+    def supply_event(self, _fd, _condition):
+        """Check the AC adapter when the kernel reports a change of
+        a Mains power supply"""
+        names = [os.path.basename(os.path.dirname(fname))
+                 for fname in self.system.mains]
+        try:
+            events = self.uevents.read()
+        except IOError as error:
+            print("Reading uevents failed:", error)
+            return True
+        if any(event.get("POWER_SUPPLY_NAME") in names for event in events):
+            self.check_supply()
+        return True
+
+    def _supply_due(self):
+        """Timer for a debounced state that has become due"""
+        self.supply_timer = None
+        self.check_supply()
+        return False
+
+    def check_supply(self):
+        """Read the AC adapter state and switch the power profile when
+        it changed, the first reading is always applied"""
+        now = time.time()
+        online = self.supply.update(now, self.system.get_online())
+        due = self.supply.due(now)
+        if due is not None and self.supply_timer is None:
+            # no more events may come, check again when it is due
+            self.supply_timer = GObject.timeout_add(
+                int(1000 * due) + 1, self._supply_due)
+        if online is None:
+            return
+        power = neptune.POWER_AC if online else neptune.POWER_BATTERY
+        if power not in self.system.values["power"]:
+            return
+
+        def reply(_failed):
+            """Notify with the new state"""
+            self.update_state(("power", ))
+            if online:
+                self.info("Power connected",
+                          "Now on {0} mode".format(power))
+            else:
+                self.info("Power disconnected",
+                          "Now on {0} mode".format(power))
+
+        def error(exception):
+            """Error handler"""
+            print("Switching to {0} failed:".format(power), exception)
+
+        self.run_write("supply", self.system.apply_profile,
+                       ({"power": power}, ), reply, error)
+
+    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender")
+    def supply_changed(self, sender=None):
+        """Check the AC adapter now, called by the power.d hook on plug
+        events, boot and resume; the call starts the daemon if it is not
+        running"""
+        self.authorize("supply_changed", sender)
+        if self.system.ready["battery"].is_set() and self.system.mains:
+            self.check_supply()
+
+    def _updating(self, reply_handler, subsystems):
+        """Wrap reply_handler to first emit the changes of a write
+        to subsystems"""
+        def reply(*args):
+            """Reply handler"""
+            self.update_state(subsystems)
+            reply_handler(*args)
+        return reply
+
+    @dbus.service.signal(neptune.DBUS_INTERFACE, signature="a{sv}")
+    def state_changed(self, changed):
+        """Signal with the changed keys of get_state, and the list of
+        keys that are gone under removed"""
+        # (method coud be function) pylint: disable=R0201
+
+        pass
 
     @dbus.service.signal(neptune.DBUS_INTERFACE)
     def info(self, title, message):
@@ -46,109 +345,254 @@ class ControlObject(PolkitDBus):
         """Emit info signal"""
         self.info(title, message)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE)
-    def get_brightness(self, backlight="default"):
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_brightness(self, backlight="default", reply_handler=None,
+                       error_handler=None):
         """Return brightness"""
-        try:
-            return self.system.get_brightness(backlight)
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
+        def read():
+            """Read once the backlights are known"""
+            with self.stats.measure("get_brightness", "read"):
+                return self._system_call(self.system.get_brightness,
+                                         backlight)
+        self.when_ready(("backlight", ), read, reply_handler, error_handler)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender")
-    def set_brightness(self, brightness, backlight="default", sender=None):
-        """Return brightness"""
-        self.check_polkit(sender, "{0}.control".format(neptune.POLKIT_SERVICE))
-        try:
-            self.system.set_brightness(brightness, backlight)
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
+    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender",
+                         async_callbacks=("reply_handler", "error_handler"))
+    def set_brightness(self, brightness, backlight="default", sender=None,
+                       reply_handler=None, error_handler=None):
+        """Set the brightness"""
+        start = time.monotonic()
+        self.authorize("set_brightness", sender)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender")
-    def update_brightness(self, change, backlight="default", sender=None):
-        """Return brightness"""
-        self.check_polkit(sender, "{0}.control".format(neptune.POLKIT_SERVICE))
-        try:
-            self.system.update_brightness(change, backlight)
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
+        def write():
+            """Write once the backlights are known"""
+            with self.stats.measure("set_brightness", "write"):
+                self._system_call(self.system.set_brightness, brightness,
+                                  backlight)
+            self.update_state(("backlight", ))
+            self.stats.add("set_brightness", "total",
+                           time.monotonic() - start)
+        self.when_ready(("backlight", ), write, reply_handler, error_handler)
+
+    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender",
+                         async_callbacks=("reply_handler", "error_handler"))
+    def update_brightness(self, change, backlight="default", sender=None,
+                          reply_handler=None, error_handler=None):
+        """Change brightness, calls within BRIGHTNESS_WINDOW are combined"""
+        self.authorize("update_brightness", sender)
+
+        def update():
+            """Queue the change once the backlights are known"""
+            if backlight not in self.system.backlight:
+                raise dbus.DBusException(
+                    "Unknown backlight: {0}".format(backlight))
+            if backlight not in self.brightness_changes:
+                self.brightness_changes[backlight] = 0
+                GObject.timeout_add(BRIGHTNESS_WINDOW,
+                                    self._flush_brightness, backlight)
+            self.brightness_changes[backlight] += change
+        self.when_ready(("backlight", ), update, reply_handler,
+                        error_handler)
+
+    def _flush_brightness(self, backlight):
+        """Apply the combined update_brightness calls in one write"""
+        change = self.brightness_changes.pop(backlight, 0)
+        if change != 0:
+            with self.stats.measure("update_brightness", "write"):
+                self.system.update_brightness(change, backlight)
+            self.update_state(("backlight", ))
+        return False
 
-    @dbus.service.method(neptune.DBUS_INTERFACE, out_signature='a{ss}')
-    def get_battery(self):
+    @dbus.service.method(neptune.DBUS_INTERFACE, out_signature='a{ss}',
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_battery(self, reply_handler=None, error_handler=None):
         """Return battery settings"""
-        try:
-            battery = self.system.get_battery()
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
-        return dict(zip(battery.keys(),
-                        [str(val) for val in battery.values()]))
+        def read():
+            """Read once the batteries are known"""
+            with self.stats.measure("get_battery", "read"):
+                battery = self._system_call(self.system.get_battery)
+            return dict(zip(battery.keys(),
+                            [str(val) for val in battery.values()]))
+        self.when_ready(("battery", ), read, reply_handler, error_handler)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE)
-    def get_power(self):
-        """Return power setting"""
-        try:
-            return self.system.get_power()
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
+    @dbus.service.method(neptune.DBUS_INTERFACE, out_signature="a{sv}",
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_state(self, reply_handler=None, error_handler=None):
+        """Return brightness, power, cpu and battery with typed values"""
+        def read():
+            """Read once everything is discovered"""
+            with self.stats.measure("get_state", "read"):
+                return to_dbus(self._system_call(self.system.get_state))
+        self.when_ready(SUBSYSTEMS, read, reply_handler, error_handler)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender")
-    def set_power(self, power, sender=None):
-        """Return brightness"""
-        self.check_polkit(sender, "{0}.control".format(neptune.POLKIT_SERVICE))
-        try:
-            self.system.set_power(power)
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
+    @dbus.service.method(neptune.DBUS_INTERFACE, in_signature="a{sv}",
+                         out_signature="a{sv}", sender_keyword="sender",
+                         async_callbacks=("reply_handler", "error_handler"))
+    def apply_profile(self, profile, sender=None, reply_handler=None,
+                      error_handler=None):
+        """Apply any of cpu, power, brightness and backlight with one
+        authorization and one info signal (with the optional title and
+        message), return the new state with the unwritable files
+        in failed"""
+        self.authorize("apply_profile", sender)
+        profile = dict(profile)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE)
-    def get_cpu(self):
+        def reply(failed):
+            """Notify once and return the new state"""
+            state = self.update_state([
+                subsystem for setting, subsystem
+                in (("cpu", "cpu"), ("power", "power"),
+                    ("brightness", "backlight")) if setting in profile])
+            messages = ["{0} set to {1}".format(name, value) for name, value
+                        in (("CPU", state.get("cpu")),
+                            ("Power", state.get("power")),
+                            ("Brightness", state.get("brightness", {}).get(
+                                profile.get("backlight", "default"))))
+                        if name.lower() in profile]
+            self.info(profile.get("title", "Neptune"),
+                      profile.get("message", "\n".join(messages)))
+            state = dict(state, failed=failed)
+            reply_handler(to_dbus(state))
+
+        self.run_write("apply_profile", self.system.apply_profile,
+                       (profile,), reply, error_handler)
+
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_power(self, reply_handler=None, error_handler=None):
         """Return power setting"""
-        try:
-            return self.system.get_cpu()
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
+        def read():
+            """Read once the kernel.ini files are known"""
+            with self.stats.measure("get_power", "read"):
+                return self._system_call(self.system.get_power)
+        self.when_ready(("power", ), read, reply_handler, error_handler)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender")
-    def set_cpu(self, cpu, sender=None):
-        """Return brightness"""
-        self.check_polkit(sender, "{0}.control".format(neptune.POLKIT_SERVICE))
-        try:
-            self.system.set_cpu(cpu)
-        except neptune.Error as error:
-            raise dbus.DBusException(error)
+    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender",
+                         out_signature="a{s(sd)}",
+                         async_callbacks=("reply_handler", "error_handler"))
+    def set_power(self, power, sender=None, reply_handler=None,
+                  error_handler=None):
+        """Set power, return {fname: (status, seconds)}"""
+        self.authorize("set_power", sender)
+        self.run_write("set_power", self.system.set_power, (power,),
+                       self._updating(reply_handler, ("power", )),
+                       error_handler)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE)
-    def get_backlights(self):
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_cpu(self, reply_handler=None, error_handler=None):
+        """Return the CPU governor"""
+        def read():
+            """Read once the policies are known"""
+            with self.stats.measure("get_cpu", "read"):
+                return self._system_call(self.system.get_cpu)
+        self.when_ready(("cpu", ), read, reply_handler, error_handler)
+
+    @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword="sender",
+                         async_callbacks=("reply_handler", "error_handler"))
+    def set_cpu(self, cpu, sender=None, reply_handler=None,
+                error_handler=None):
+        """Set the CPU governor"""
+        self.authorize("set_cpu", sender)
+        self.run_write("set_cpu", self.system.set_cpu, (cpu,),
+                       self._updating(reply_handler, ("cpu", )),
+                       error_handler)
+
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_backlights(self, reply_handler=None, error_handler=None):
         """Return the possible backlight operators"""
-        return list(self.system.backlight.keys())
+        self.when_ready(("backlight", ),
+                        lambda: list(self.system.backlight.keys()),
+                        reply_handler, error_handler)
 #         return [backlight for backlight in self.system.backlight.keys()
 #                 if backlight != "default"]
 
-    @dbus.service.method(neptune.DBUS_INTERFACE)
-    def get_max_brightness(self, backlight):
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_max_brightness(self, backlight, reply_handler=None,
+                           error_handler=None):
         """Return the maximum available backlight"""
-        return self.system.backlight[backlight]["max"]
+        self.when_ready(("backlight", ),
+                        lambda: self._backlight(backlight)["max"],
+                        reply_handler, error_handler)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE)
-    def get_min_brightness(self, backlight):
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_min_brightness(self, backlight, reply_handler=None,
+                           error_handler=None):
         """Return the maximum available backlight"""
-        return self.system.backlight[backlight]["min"]
+        self.when_ready(("backlight", ),
+                        lambda: self._backlight(backlight)["min"],
+                        reply_handler, error_handler)
 
-    @dbus.service.method(neptune.DBUS_INTERFACE)
-    def get_values(self, name):
+    def _backlight(self, backlight):
+        """Options of backlight, DBusException if unknown"""
+        if backlight not in self.system.backlight:
+            raise dbus.DBusException(
+                "Unknown backlight: {0}".format(backlight))
+        return self.system.backlight[backlight]
+
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         async_callbacks=("reply_handler", "error_handler"))
+    def get_values(self, name, reply_handler=None, error_handler=None):
         """Return power setting"""
-        if name in self.system.values:
-            values = self.system.values[name]
-            if len(values) < 20:
-                return values
+        def read():
+            """Read once the values of name are known"""
+            if name in self.system.values:
+                values = self.system.values[name]
+                if len(values) < 20:
+                    return values
+                else:
+                    return [values[i] for i in range(
+                        0, len(values),
+                        int(len(values) / 20) + 1)] + [values[-1]]
             else:
-                return [values[i] for i in range(
-                    0, len(values),
-                    int(len(values) / 20) + 1)] + [values[-1]]
-        else:
-            raise dbus.DBusException("No values for {0}".format(name))
+                raise dbus.DBusException("No values for {0}".format(name))
+        self.when_ready((SETTINGS[name], ) if name in SETTINGS else SUBSYSTEMS,
+                        read, reply_handler, error_handler)
+
+    @dbus.service.method(neptune.DBUS_INTERFACE, in_signature="dd",
+                         out_signature="a(dddds)")
+    def get_history(self, start, end):
+        """Return battery samples (timestamp, rate, voltage, capacity,
+        state) with start <= timestamp < end, end 0 is no limit"""
+        return self.history.query(start, end if end > 0 else None)
+
+    @dbus.service.method(neptune.DBUS_INTERFACE,
+                         out_signature="dadadadad")
+    def get_frequencies(self):
+        """Return the time of the last sample, the last frequency of
+        every cpufreq policy, in the order of their numbers, and their
+        min, mean and max over the last window, in kHz"""
+        timestamp, latest, minimum, mean, maximum = self.frequencies.get()
+        return (timestamp, latest.tolist(), minimum.tolist(), mean.tolist(),
+                maximum.tolist())
+
+    @dbus.service.method(neptune.DBUS_INTERFACE, out_signature="a{sa{sd}}")
+    def get_energy(self):
+        """Return {"power/cpu": {seconds, discharging, wh, watts}}, the
+        time in each state, the time and energy on battery and the mean
+        power on battery"""
+        return self.energy.get()
+
+    @dbus.service.method(neptune.DBUS_INTERFACE, out_signature="a{sa{sd}}")
+    def get_stats(self):
+        """Return {method.phase: {count, errors, p50, p95, p99}}
+        and the polkit cache hits and misses"""
+        stats = self.stats.get()
+        stats["polkit.cache"] = dict(self.auth_stats)
+        return stats
 
     @dbus.service.method(neptune.DBUS_INTERFACE, sender_keyword='sender')
     def exit(self, sender=None):
         """Exit server process"""
-        self.check_polkit(sender, "{0}.exit".format(neptune.POLKIT_SERVICE))
+        self.authorize("exit", sender, "exit")
+        if self.telemetry:
+            self.telemetry.close()
+            self.telemetry = None
+        if self.uevents:
+            self.uevents.close()
+            self.uevents = None
         self.stop()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Call counts and latencies of the D-Bus methods"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import time
+import threading
+import contextlib
+import collections
+
+# latencies kept per method and phase for the percentiles
+SAMPLES = 1024
+PERCENTILES = (50, 95, 99)
+
+
+class Stats(object):
+    """Count calls and errors and keep recent latencies
+
+    Calls are recorded per phase: "auth", "read" and "write", and
+    "total" for methods with more than one phase. Only the last SAMPLES
+    latencies of a phase are kept.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = collections.defaultdict(int)
+        self.errors = collections.defaultdict(int)
+        self.latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=SAMPLES))
+
+    def add(self, method, phase, seconds, error=False):
+        """Record one call of a phase"""
+        key = "{0}.{1}".format(method, phase)
+        with self.lock:
+            self.counts[key] += 1
+            if error:
+                self.errors[key] += 1
+            self.latencies[key].append(seconds)
+
+    @contextlib.contextmanager
+    def measure(self, method, phase="total"):
+        """Record the time spent in the with block"""
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.add(method, phase, time.monotonic() - start, True)
+            raise
+        self.add(method, phase, time.monotonic() - start)
+
+    def get(self):
+        """Return {method.phase: {count, errors, p50, p95, p99}},
+        latencies in seconds"""
+        stats = {}
+        with self.lock:
+            for key, count in self.counts.items():
+                latencies = sorted(self.latencies[key])
+                stats[key] = {"count": count, "errors": self.errors[key]}
+                for percentile in PERCENTILES:
+                    # nearest rank
+                    index = max(0, -(-percentile * len(latencies) // 100) - 1)
+                    stats[key]["p{0}".format(percentile)] = latencies[index]
+        return stats
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Debounced AC adapter state and power_supply uevents"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import errno
+import socket
+
+# linux/netlink.h, group 1 are the kernel events
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_GROUP = 1
+UEVENT_SIZE = 16384
+
+
+class SupplyWatch(object):
+    """Decide when to switch profiles on AC plug and unplug
+
+    The first reading is applied at once, as the profile may not match
+    after a boot, a resume or a plug while the daemon was not running.
+    Later a new online state is only acted on after it has been stable
+    for debounce seconds, and not earlier than holdoff seconds after
+    the previous switch, so a flapping connector causes at most one
+    switch per holdoff.
+    """
+
+    def __init__(self, debounce, holdoff):
+        self.debounce = debounce
+        self.holdoff = holdoff
+        self.applied = None
+        self.candidate = None
+        self.since = None
+        self.switched = None
+
+    def update(self, timestamp, online):
+        """Add a reading of the online state (None if unknown), return
+        the state to switch to, or None"""
+        if online is None:
+            return None
+        if online != self.candidate:
+            self.candidate = online
+            self.since = timestamp
+        if self.applied is not None and (
+                self.candidate == self.applied or
+                timestamp - self.since < self.debounce or
+                (self.switched is not None and
+                 timestamp - self.switched < self.holdoff)):
+            return None
+        self.applied = self.candidate
+        self.switched = timestamp
+        return self.applied
+
+    def due(self, timestamp):
+        """Seconds until a pending state can be switched to, None if
+        there is none"""
+        if self.candidate is None or self.candidate == self.applied:
+            return None
+        due = self.since + self.debounce
+        if self.switched is not None:
+            due = max(due, self.switched + self.holdoff)
+        return max(0, due - timestamp)
+
+
+class UeventMonitor(object):
+    """Kernel uevents of a subsystem from a netlink socket
+
+    The socket is only read when the kernel sends an event, so the
+    adapter state costs nothing between plug events.
+    """
+
+    def __init__(self, subsystem):
+        self.subsystem = subsystem
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                      NETLINK_KOBJECT_UEVENT)
+            self.sock.bind((0, UEVENT_GROUP))
+        except (AttributeError, socket.error) as error:
+            raise IOError("Cannot listen to uevents: {0}".format(error))
+        self.sock.setblocking(False)
+
+    def fileno(self):
+        """File descriptor to watch for events"""
+        return self.sock.fileno()
+
+    def close(self):
+        """Close the socket"""
+        self.sock.close()
+
+    def read(self):
+        """Return the pending events of the subsystem as dicts of the
+        uevent variables"""
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(UEVENT_SIZE)
+            except socket.error as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return events
+                raise
+            # action@devpath, then KEY=VALUE, separated by NUL
+            fields = data.decode("utf-8", "replace").split("\0")
+            event = dict(field.split("=", 1) for field in fields[1:]
+                         if "=" in field)
+            if event.get("SUBSYSTEM") == self.subsystem:
+                events.append(event)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Read /sys and /proc attributes through persistent descriptors"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import os
+import errno
+import threading
+
+# sysfs attributes are at most one page
+BUFFER_SIZE = 4096
+MAX_OPEN = 512
+
+# errors after which the descriptor is reopened
+STALE_ERRORS = (errno.ENODEV, errno.ENOENT, errno.ESTALE, errno.EBADF,
+                errno.ENXIO)
+
+
+class SysfsReader(object):
+    """Keep attributes open and re-read them with pread
+
+    Every monitored path keeps an open descriptor, read with a single
+    pread into one preallocated buffer shared under the lock, instead
+    of an open/read/close triple. Descriptors of devices that
+    disappeared are reopened on the next read.
+    """
+
+    def __init__(self, max_open=MAX_OPEN):
+        self.max_open = max_open
+        # {path: descriptor or None}
+        self.files = {}
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.open_count = 0
+        self.lock = threading.Lock()
+
+    def add(self, path):
+        """Monitor path, it is opened on first read"""
+        with self.lock:
+            if path not in self.files:
+                self.files[path] = None
+
+    def discard(self, path):
+        """Stop monitoring path"""
+        with self.lock:
+            if path in self.files:
+                self._close(path)
+                del self.files[path]
+
+    def close(self):
+        """Close all descriptors"""
+        with self.lock:
+            for path in self.files:
+                self._close(path)
+            self.files = {}
+
+    def read(self, path):
+        """Return the stripped contents of path, raise IOError if
+        it cannot be read"""
+        with self.lock:
+            size = self._retry(path)
+            return bytes(memoryview(self.buffer)[:size]).decode(
+                "utf-8", "replace").strip()
+
+    def read_int(self, path):
+        """Return the decimal number at the start of path, parsed in
+        the shared buffer without copying it, raise IOError if it
+        cannot be read and ValueError if it holds no number"""
+        with self.lock:
+            size = self._retry(path)
+            buf = self.buffer
+            value = 0
+            index = 0
+            while index < size and 48 <= buf[index] <= 57:
+                value = 10 * value + buf[index] - 48
+                index += 1
+            if index == 0:
+                raise ValueError("No number in {0}".format(path))
+            return value
+
+    def snapshot(self):
+        """Read all monitored attributes in one pass,
+        unreadable attributes are None"""
+        values = {}
+        for path in list(self.files.keys()):
+            try:
+                values[path] = self.read(path)
+            except IOError:
+                values[path] = None
+        return values
+
+    def _retry(self, path):
+        """Read path into the shared buffer, reopening it once if the
+        device went away, return the size, the lock is held"""
+        if path not in self.files:
+            self.files[path] = None
+        try:
+            return self._read(path)
+        except (IOError, OSError) as error:
+            if error.errno not in STALE_ERRORS:
+                raise IOError(error.errno, error.strerror, path)
+        self._close(path)
+        try:
+            return self._read(path)
+        except (IOError, OSError) as error:
+            self._close(path)
+            raise IOError(error.errno, error.strerror, path)
+
+    def _read(self, path):
+        """Read path into the shared buffer, return the size"""
+        fd = self.files[path]
+        if fd is None:
+            if self.open_count >= self.max_open:
+                # too many descriptors, fall back to a one-shot read
+                with open(path, "rb") as fobj:
+                    data = fobj.read()
+                if len(data) > len(self.buffer):
+                    self.buffer = bytearray(len(data))
+                self.buffer[:len(data)] = data
+                return len(data)
+            fd = self.files[path] = os.open(path, os.O_RDONLY)
+            self.open_count += 1
+
+        size = self._pread(fd, self.buffer)
+        while size == len(self.buffer):
+            # buffer too small, grow it and read again
+            self.buffer = bytearray(2 * len(self.buffer))
+            size = self._pread(fd, self.buffer)
+        return size
+
+    @staticmethod
+    def _pread(fd, buf):
+        """Read from the start of fd into buf, return the size"""
+        if hasattr(os, "preadv"):
+            return os.preadv(fd, [buf], 0)
+        data = os.pread(fd, len(buf), 0)
+        buf[:len(data)] = data
+        return len(data)
+
+    def _close(self, path):
+        """Close the descriptor of path"""
+        fd = self.files.get(path)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+            self.files[path] = None
+            self.open_count -= 1
@@ -8,28 +8,101 @@ from __future__ import (division, absolute_import, unicode_literals,
 
 import os
 import re
-import configobj
+import time
+import threading
 import collections
 import six
 
 import neptune
+from .sysfs import SysfsReader
+from .writer import ParallelWriter
+from .estimate import TimeLeftEstimator
+from . import expand
+
+# power_supply uevent keys, in uA, uAh, uV, uW and uWh
+UEVENT = re.compile(
+    r"^POWER_SUPPLY_(STATUS|CHARGE_NOW|CURRENT_NOW|ENERGY_NOW|POWER_NOW|"
+    r"VOLTAGE_NOW|VOLTAGE_MIN_DESIGN)=(.*)$", re.MULTILINE)
+
+# discovered in this order, see System.wait
+SUBSYSTEMS = ("backlight", "battery", "cpu", "power")
+# seconds a call waits for the discovery of a subsystem
+INIT_TIMEOUT = 20
+# keys of get_state read from each subsystem
+STATE_KEYS = {"backlight": ("backlight", "brightness"),
+              "battery": ("battery", ), "cpu": ("cpu_policies", "cpu"),
+              "power": ("power", )}
+# subsystem of the values of test_available
+SETTINGS = {"cpu": "cpu", "cpu_no": "cpu", "power": "power"}
 
 
 class System(object):
     """All control commands"""
 
-    def __init__(self):
+    def __init__(self, deferred=False):
+        """Discover the backlights, batteries, CPUs and kernel.ini files,
+        in a background thread if deferred"""
         self.values = collections.defaultdict(list)
-        self.backlight = self.get_backlight()
+        self.reader = SysfsReader()
+        self.writer = ParallelWriter(neptune.WRITE_THREADS,
+                                     neptune.WRITE_PARALLEL_MIN)
+        self.write_lock = threading.Lock()
+        self.ready = dict((subsystem, threading.Event())
+                          for subsystem in SUBSYSTEMS)
+        self.backlight = {}
 
         self.capacity_low = 0
         self.battery = None
-        self.init_battery()
+        self.batteries = []
+        self.mains = []
+        self.estimator = TimeLeftEstimator()
 
-        self.init_cpu()
+        self.policies = {}
 
         self.kernel = {}
-        self.init_power()
+        self.groups = {}
+        self.profiles = {}
+        self.current = {}
+        self.mismatches = {}
+        self.stale = set()
+        self.sequences = {}
+        self.cache_lock = threading.Lock()
+
+        if deferred:
+            thread = threading.Thread(target=self.discover)
+            thread.daemon = True
+            thread.start()
+        else:
+            self.discover()
+
+    def discover(self):
+        """Init the subsystems in order, each one is usable as soon as
+        its discovery is done"""
+        steps = {"backlight": self.init_backlight,
+                 "battery": self.init_battery,
+                 "cpu": self.init_cpu,
+                 "power": self.init_power}
+        for subsystem in SUBSYSTEMS:
+            try:
+                steps[subsystem]()
+            except Exception as error:  # (catch all) pylint: disable=W0703
+                print("Cannot init {0}: {1}".format(subsystem, error))
+            finally:
+                self.ready[subsystem].set()
+
+    def wait(self, *subsystems):
+        """Wait until the subsystems (default all) are discovered"""
+        for subsystem in subsystems or SUBSYSTEMS:
+            if not self.ready[subsystem].wait(INIT_TIMEOUT):
+                raise neptune.Error(
+                    "Still discovering {0}".format(subsystem))
+
+    def init_backlight(self):
+        """Init the backlights"""
+        self.backlight = self.get_backlight()
+        for options in self.backlight.values():
+            self.reader.add(os.path.join(options["path"],
+                                         "actual_brightness"))
 
     @staticmethod
     def get_backlight():
@@ -63,11 +136,38 @@ class System(object):
         return backlights
 
     def init_battery(self):
-        """Init the battery settings"""
-        for battery in neptune.BATTERIES.keys():
-            if os.path.exists(battery):
-                self.battery = battery
-                break
+        """Init the battery settings, all system batteries in /sys are
+        used, otherwise the first battery in /proc"""
+        self.batteries = []
+        self.mains = []
+        try:
+            for name in sorted(os.listdir(neptune.POWER_SUPPLY_DIR)):
+                path = os.path.join(neptune.POWER_SUPPLY_DIR, name)
+                try:
+                    with open(os.path.join(path, "type"), "r") as fobj:
+                        supply_type = fobj.read().strip()
+                    if supply_type == "Battery":
+                        fname = os.path.join(path, "uevent")
+                        with open(fname, "r") as fobj:
+                            # mice, keyboards and headsets
+                            if "POWER_SUPPLY_SCOPE=Device\n" in fobj.read():
+                                continue
+                        self.batteries.append(fname)
+                    elif supply_type == "Mains":
+                        self.mains.append(os.path.join(path, "online"))
+                except IOError:
+                    pass
+        except OSError:
+            pass
+        for fname in self.batteries + self.mains:
+            self.reader.add(fname)
+
+        if not self.batteries:
+            for battery in neptune.BATTERIES.keys():
+                if os.path.exists(battery):
+                    self.battery = battery
+                    self.reader.add(battery)
+                    break
 
         try:
             with open(neptune.BATTERY_INFO, "r") as fobj:
@@ -78,50 +178,88 @@ class System(object):
             pass
 
     def init_cpu(self):
-        """Init the CPU setting"""
+        """Init the CPU setting, governors are handled per cpufreq policy,
+        or per CPU on kernels without policy directories"""
         try:
             self.values["cpu_no"] = [
                 cpu_no for cpu_no in os.listdir(neptune.CPU_DIR)
-                if re.match(r"cpu\d+", cpu_no)]
+                if re.match(r"cpu\d+$", cpu_no)]
+            self.values["cpu_no"].sort(key=lambda cpu_no: int(cpu_no[3:]))
         except OSError:
             pass
 
+        # in the order of the policy numbers
+        self.policies = {}
+        try:
+            for policy in sorted(
+                    (policy for policy in os.listdir(
+                        os.path.join(neptune.CPU_DIR, "cpufreq"))
+                     if re.match(r"policy\d+$", policy)),
+                    key=lambda policy: int(policy[6:])):
+                self.policies[policy] = os.path.join(
+                    neptune.CPU_DIR, "cpufreq", policy)
+        except OSError:
+            pass
+        if not self.policies:
+            self.policies = dict(
+                (cpu_no, os.path.join(neptune.CPU_DIR, cpu_no, "cpufreq"))
+                for cpu_no in self.values["cpu_no"])
+        for path in self.policies.values():
+            self.reader.add(os.path.join(path, "scaling_governor"))
+
         try:
             fname = os.path.join(
-                neptune.CPU_DIR, "cpu0", "cpufreq",
+                sorted(self.policies.values())[0],
                 "scaling_available_governors")
             with open(fname, "r") as fobj:
                 governors = fobj.read().strip()
                 if governors != "":
                     self.values["cpu"] = governors.split(" ")
-        except IOError:
+        except (IOError, IndexError):
             pass
 
     def init_power(self):
         """Init the power settings"""
         self.kernel = {}
-        config = configobj.ConfigObj(
-            os.path.join(neptune.CONFIG_DIR, "kernel.ini"))
-        for fname, options in config.items():
+        self.groups = {}
+        import configobj
+
+        config_fname = os.path.join(neptune.CONFIG_DIR, "kernel.ini")
+        config = configobj.ConfigObj(config_fname)
+        expanded = expand.expand(
+            [neptune.SYSFS_ROOT + pattern for pattern in config.keys()],
+            config_fname, os.path.join(neptune.CACHE_DIR, "kernel.json"))
+        for pattern, options in config.items():
+            group = options.pop("group", None)
             for power in options:
                 if not isinstance(options[power], list):
                     options[power] = [options[power]]
-            if "/*/" in fname:
-                dirname, search = fname.split("/*/")
-                if os.path.exists(dirname):
-                    for subdir in os.listdir(dirname):
-                        fname2 = os.path.join(dirname, subdir, search)
-                        if os.path.exists(fname2):
-                            self.kernel[fname2] = options
-            elif os.path.exists(fname):
+            for fname in expanded[neptune.SYSFS_ROOT + pattern]:
                 self.kernel[fname] = options
+                self.groups[fname] = group or fname
+
+        for fname in self.kernel.keys():
+            self.reader.add(fname)
 
         self.values["power"] = list(set([
             power for options in self.kernel.values()
             for power in options.keys()]))
 
+        # {power: {fname: values}} and the cached current values,
+        # mismatches counts the files of a profile at another value
+        self.profiles = dict((power, {}) for power in self.values["power"])
+        for fname, options in self.kernel.items():
+            for power, values in options.items():
+                self.profiles[power][fname] = values
+        self.current = dict((fname, None) for fname in self.kernel.keys())
+        self.mismatches = dict((power, 0) for power in self.values["power"])
+        self.stale = set(self.kernel.keys())
+        self.sequences = dict((fname, 0) for fname in self.kernel.keys())
+
     def test_available(self, setting, value):
         """Test if the key is available"""
+        if setting in SETTINGS:
+            self.wait(SETTINGS[setting])
         if value not in self.values[setting]:
             raise neptune.Error(
                 ("Unknown {setting} setting: {value}\n" +
@@ -132,16 +270,17 @@ class System(object):
 
     def get_brightness(self, backlight="default"):
         """Get the current brightness"""
+        self.wait("backlight")
         try:
-            with open(os.path.join(self.backlight[backlight]["path"],
-                                   "actual_brightness"), "r") as fobj:
-                return int(fobj.read().strip())
-        except IOError:
+            return int(self.reader.read(os.path.join(
+                self.backlight[backlight]["path"], "actual_brightness")))
+        except (IOError, ValueError):
             raise neptune.Error(
                 "Backlight control unreadable: {0}".format(backlight))
 
     def set_brightness(self, brightness, backlight="default"):
         """Set the brightness"""
+        self.wait("backlight")
         if brightness == "max":
             brightness = self.backlight[backlight]["max"]
         if brightness == "min":
@@ -159,10 +298,19 @@ class System(object):
             raise neptune.Error("Backlight unwritable: {0}".format(backlight))
 
     def update_brightness(self, change, backlight="default"):
-        """Change the brightness"""
+        """Change the brightness, within the min and max brightness
+
+        Only the limit in the direction of the change is applied, a
+        brightness already beyond it is left alone."""
         try:
-            self.set_brightness(self.get_brightness(backlight) + change,
-                                backlight)
+            current = self.get_brightness(backlight)
+            if change > 0:
+                brightness = max(current, min(
+                    current + change, self.backlight[backlight]["max"]))
+            else:
+                brightness = min(current, max(
+                    current + change, self.backlight[backlight]["min"]))
+            self.set_brightness(brightness, backlight)
         except neptune.Error:
             pass
 
@@ -170,72 +318,128 @@ class System(object):
         """Read acpi battery from /proc"""
         battery = {}
         try:
-            with open(self.battery, "r") as fobj:
-                for line in fobj:
-                    result = re.search(r"(.*): *(\d*) (.*)", line)
-                    if result:
-                        key, value, units = result.groups()
-                        if value == "":
-                            value = units.lower()
-                        else:
-                            value = int(value)
-                        if key in neptune.BATTERIES[self.battery]:
-                            battery[neptune.BATTERIES[self.battery][key]] \
-                                = value
+            for line in self.reader.read(self.battery).splitlines():
+                result = re.search(r"(.*): *(\d*) (.*)", line)
+                if result:
+                    key, value, units = result.groups()
+                    if value == "":
+                        value = units.lower()
+                    else:
+                        value = int(value)
+                    if key in neptune.BATTERIES[self.battery]:
+                        battery[neptune.BATTERIES[self.battery][key]] \
+                            = value
         except IOError:
             print("Cannot read battery", self.battery)
         return battery
 
     def get_battery_sys(self):
-        """Read acpi battery from /proc"""
-        battery = {}
-        try:
-            with open(self.battery, "r") as fobj:
-                for line in fobj:
-                    result = re.search("(.*)=(.*)", line)
-                    if result:
-                        key, value = result.groups()
-                        value = value.lower()
-                        try:
-                            value = int(value) // 1000
-                        except ValueError:
-                            pass
-                        if key in neptune.BATTERIES[self.battery]:
-                            battery[neptune.BATTERIES[self.battery][key]] \
-                                = value
-        except IOError:
-            print("Cannot open battery {0}".format(self.battery))
+        """Read all batteries from /sys and combine them"""
+        readings = []
+        for battery in self.batteries:
+            try:
+                readings.append(self.parse_uevent(self.reader.read(battery)))
+            except IOError:
+                print("Cannot open battery {0}".format(battery))
+        return self.combine_batteries(readings)
+
+    @staticmethod
+    def parse_uevent(text):
+        """Parse a power_supply uevent into mAh, mA and mV,
+        energy based batteries are converted with their voltage"""
+        values = dict(UEVENT.findall(text))
+        voltage = int(values.get("VOLTAGE_NOW") or
+                      values.get("VOLTAGE_MIN_DESIGN") or 0)
+        battery = {"state": values.get("STATUS", "unknown").lower(),
+                   "voltage": voltage // 1000}
+        if "CHARGE_NOW" in values:
+            battery["capacity"] = int(values["CHARGE_NOW"]) // 1000
+            battery["rate"] = abs(int(values.get("CURRENT_NOW", 0))) // 1000
+            battery["watts"] = (battery["voltage"] / 1000 *
+                                battery["rate"] / 1000)
+        elif "ENERGY_NOW" in values and voltage > 0:
+            power = abs(int(values.get("POWER_NOW", 0)))
+            battery["capacity"] = int(values["ENERGY_NOW"]) * 1000 // voltage
+            battery["rate"] = power * 1000 // voltage
+            battery["watts"] = power / 1000000
         return battery
 
+    @staticmethod
+    def combine_batteries(readings):
+        """Combine the batteries into one reading, the rate and power
+        are those of the batteries in the combined state"""
+        readings = [battery for battery in readings if "capacity" in battery]
+        if len(readings) == 0:
+            return {}
+        states = [battery["state"] for battery in readings]
+        if "discharging" in states:
+            state = "discharging"
+        elif "charging" in states:
+            state = "charging"
+        else:
+            state = states[0]
+        active = [battery for battery in readings
+                  if battery["state"] == state]
+        return {
+            "state": state,
+            "capacity": sum(battery["capacity"] for battery in readings),
+            "voltage": (sum(battery["voltage"] for battery in readings) //
+                        len(readings)),
+            "rate": sum(battery["rate"] for battery in active),
+            "watts": sum(battery["watts"] for battery in active)}
+
     def get_battery(self):
         """Get the current battery status"""
-        if not self.battery:
-            return {}
-        if self.battery.startswith("/proc"):
-            battery = self.get_battery_proc()
-        elif self.battery.startswith("/sys"):
+        self.wait("battery")
+        if self.batteries:
             battery = self.get_battery_sys()
+        elif self.battery:
+            battery = self.get_battery_proc()
         else:
             return {}
 
-        if battery["state"] == "discharging" and battery["rate"] > 0:
-            battery["watts"] = (battery["voltage"] / 1000 *
-                                battery["rate"] / 1000)
-            battery["timeleft"] = ((battery["capacity"] - self.capacity_low) /
-                                   battery["rate"])
+        if battery.get("state") == "discharging" and battery["rate"] > 0:
+            battery.setdefault("watts", battery["voltage"] / 1000 *
+                               battery["rate"] / 1000)
+            self.estimator.add(time.time(), battery["rate"])
+            battery["timeleft"], battery["confidence"] = \
+                self.estimator.estimate(
+                    battery["capacity"] - self.capacity_low)
+        else:
+            battery.pop("watts", None)
+            if battery.get("state") != "discharging":
+                self.estimator.reset()
         return battery
 
-    def get_cpu(self):
-        """Get the current governor"""
-        cpu_set = set()
-        for cpu_no in self.values["cpu_no"]:
+    def get_online(self):
+        """Return whether an AC adapter is online, None if there is no
+        readable adapter"""
+        self.wait("battery")
+        online = None
+        for fname in self.mains:
+            try:
+                if self.reader.read(fname) == "1":
+                    return True
+                online = False
+            except IOError:
+                pass
+        return online
+
+    def get_cpu_policies(self):
+        """Get the governor of every cpufreq policy"""
+        self.wait("cpu")
+        policies = {}
+        for policy, path in self.policies.items():
             try:
-                fname = os.path.join(
-                    neptune.CPU_DIR, cpu_no, "cpufreq", "scaling_governor")
-                with open(fname, "r") as fobj:
-                    cpu_set.add(fobj.read().strip())
+                policies[policy] = self.reader.read(
+                    os.path.join(path, "scaling_governor"))
             except IOError:
                 pass
+        return policies
+
+    def get_cpu(self):
+        """Get the current governor, "mixed" if the policies differ"""
+        cpu_set = set(self.get_cpu_policies().values())
         if len(cpu_set) == 0:
             raise neptune.Error("CPU governors not available")
         elif len(cpu_set) == 1:
@@ -244,26 +448,28 @@ class System(object):
             return "mixed"
 
     def set_cpu(self, cpu):
-        """Set the CPU governor"""
+        """Set the CPU governor of the policies that differ"""
         self.test_available("cpu", cpu)
-        if cpu != self.get_cpu():
-            try:
-                for cpu_no in self.values["cpu_no"]:
-                    fname = os.path.join(
-                        neptune.CPU_DIR, cpu_no, "cpufreq", "scaling_governor")
-                    with open(fname, "w") as fobj:
-                        fobj.write("{0}".format(cpu))
-            except IOError:
+        with self.write_lock:
+            results = self.writer.run([
+                (policy, policy, self._write, (os.path.join(
+                    self.policies[policy], "scaling_governor"), cpu))
+                for policy, governor in self.get_cpu_policies().items()
+                if governor != cpu])
+            if not all(results.values()):
                 raise neptune.Error("Cannot set cpu to {0}".format(cpu))
 
     def get_power(self):
-        """Get the current power state"""
-        power_set = set(self.values["power"])
-        for _fname, options in self._get_current_kernel():
-            for power in power_set.copy():
-                if (power in options and options["current"] is not None and
-                        options["current"] not in options[power]):
-                    power_set.remove(power)
+        """Get the current power state from the cached values,
+        only the stale files are read"""
+        self.wait("power")
+        with self.cache_lock:
+            stale = list(self.stale)
+        if stale:
+            self.revalidate_power(stale)
+        with self.cache_lock:
+            power_set = set(power for power, count
+                            in self.mismatches.items() if count == 0)
 
         if len(power_set) == 1:
             return power_set.pop()
@@ -271,24 +477,151 @@ class System(object):
             return "mixed"
 
     def set_power(self, power):
-        """Set the power state"""
+        """Set the power state, reading every file only once
+
+        Files are written in parallel, except those that share a group
+        in kernel.ini. Returns a report {fname: (status, seconds)} with
+        status "changed", "unchanged" or "failed".
+        """
         self.test_available("power", power)
-        if power != self.get_power():
-            for fname, options in self._get_current_kernel():
-                if power in options \
-                        and options["current"] not in options[power]:
-                    try:
-                        with open(fname, "w") as fobj:
-                            fobj.write("{0}".format(options[power][0]))
-                    except IOError:
-                        print("Cannot write", fname, options[power][0])
-
-    def _get_current_kernel(self):
-        """Get current kernel settings"""
-        for fname, options in self.kernel.items():
+        with self.write_lock:
+            return self.writer.run([
+                (self.groups[fname], fname, self._apply_power,
+                 (fname, options[power]))
+                for fname, options in self.kernel.items()
+                if power in options])
+
+    def _apply_power(self, fname, values):
+        """Write the first of values to fname if it has none of them,
+        return (status, seconds)"""
+        start = time.time()
+        try:
+            current = self.reader.read(fname)
+        except IOError:
+            current = None
+        if current in values:
+            status = "unchanged"
+        elif self._write(fname, values[0]):
+            status = "changed"
+            current = values[0]
+        else:
+            print("Cannot write", fname, values[0])
+            status = "failed"
+        self._set_current(fname, current)
+        return status, time.time() - start
+
+    def _set_current(self, fname, current, sequence=None):
+        """Update the cached value of fname and the mismatch counts of
+        the profiles that cover it, None for unreadable files. Writes
+        pass no sequence, a value read with the sequence of fname is
+        dropped if a write came in between. Returns whether the cached
+        value changed."""
+        options = self.kernel[fname]
+        with self.cache_lock:
+            if sequence is None:
+                self.sequences[fname] += 1
+            elif sequence != self.sequences[fname]:
+                return False
+            previous = self.current[fname]
+            for power, values in options.items():
+                before = previous is not None and previous not in values
+                after = current is not None and current not in values
+                self.mismatches[power] += after - before
+            self.current[fname] = current
+            self.stale.discard(fname)
+        return current != previous
+
+    def revalidate_power(self, fnames=None):
+        """Re-read fnames (default all the power files) into the cache,
+        return whether any value changed outside the daemon. Does not
+        wait for running writes, their values win over the reads."""
+        self.wait("power")
+        changed = False
+        for fname in fnames or list(self.kernel.keys()):
+            with self.cache_lock:
+                sequence = self.sequences[fname]
             try:
-                with open(fname, "r") as fobj:
-                    options["current"] = fobj.read().strip()
+                current = self.reader.read(fname)
             except IOError:
-                options["current"] = None
-            yield fname, options
+                current = None
+            changed = self._set_current(fname, current, sequence) or changed
+        return changed
+
+    @staticmethod
+    def _write(fname, value):
+        """Write value to fname, return whether it succeeded"""
+        try:
+            with open(fname, "w") as fobj:
+                fobj.write("{0}".format(value))
+        except IOError:
+            return False
+        return True
+
+    def apply_profile(self, profile):
+        """Apply any combination of the cpu, power and brightness (of
+        backlight) settings, all are checked before anything is written.
+        Returns the files that could not be written."""
+        backlight = profile.get("backlight", "default")
+        for setting in ("cpu", "power"):
+            if setting in profile:
+                self.test_available(setting, profile[setting])
+        brightness = profile.get("brightness")
+        if "brightness" in profile:
+            self.wait("backlight")
+            if backlight not in self.backlight:
+                raise neptune.Error(
+                    "Unknown backlight: {0}".format(backlight))
+            if brightness not in ("max", "min"):
+                try:
+                    brightness = int(brightness)
+                except (TypeError, ValueError):
+                    brightness = None
+                if brightness is None or not (
+                        self.backlight[backlight]["min"] <= brightness <=
+                        self.backlight[backlight]["max"]):
+                    raise neptune.Error("Invalid brightness: {0}".format(
+                        profile["brightness"]))
+
+        failed = []
+        if "cpu" in profile:
+            self.set_cpu(profile["cpu"])
+        if "power" in profile:
+            failed = sorted(
+                fname for fname, (status, _seconds)
+                in self.set_power(profile["power"]).items()
+                if status == "failed")
+        if "brightness" in profile:
+            self.set_brightness(brightness, backlight)
+        return failed
+
+    def get_state(self, subsystems=SUBSYSTEMS):
+        """Get brightness, power, governor and battery in one pass,
+        only the keys of the given subsystems are read"""
+        self.wait(*subsystems)
+        state = {}
+        if "backlight" in subsystems:
+            state["backlight"] = dict(
+                (backlight, {"min": options["min"], "max": options["max"]})
+                for backlight, options in self.backlight.items())
+            state["brightness"] = {}
+            for backlight in self.backlight.keys():
+                try:
+                    state["brightness"][backlight] = \
+                        self.get_brightness(backlight)
+                except neptune.Error:
+                    pass
+        if "power" in subsystems:
+            state["power"] = self.get_power()
+        if "battery" in subsystems:
+            state["battery"] = self.get_battery()
+        if "cpu" in subsystems:
+            state["cpu_policies"] = self.get_cpu_policies()
+            if state["cpu_policies"]:
+                cpu_set = set(state["cpu_policies"].values())
+                state["cpu"] = (cpu_set.pop() if len(cpu_set) == 1
+                                else "mixed")
+        return state
+
+    def snapshot(self):
+        """Read all monitored attributes in one pass"""
+        return self.reader.snapshot()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Memory-mapped telemetry file that survives restarts"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import os
+import mmap
+import struct
+import zlib
+
+import neptune
+
+from .history import HISTORY_SIZE, STATES
+
+MAGIC = b"NPT1"
+VERSION = 1
+# magic, version, record size, capacity, seq, start, count,
+# time of the oldest and of the newest record, crc32 of the rest
+HEADER = struct.Struct("<4sHHIQIIdd")
+CRC = struct.Struct("<I")
+HEADER_SLOT = 64
+# names of the power profiles and governors, index 0 is unknown
+NAMES = 32
+NAME_SIZE = 16
+# ms since the previous record, rate mA, voltage mV, capacity mAh,
+# battery state, power profile, cpu governor, brightness, mean and max
+# CPU frequency MHz
+RECORD = struct.Struct("<IHHIBBBIHH")
+FIELDS = ("timestamp", "rate", "voltage", "capacity", "state", "power",
+          "cpu", "brightness", "frequency", "max_frequency")
+MAX_DELTA = 0xffffffff
+# flush to disk every FLUSH_EVERY records, the page cache keeps the
+# rest if only the daemon dies
+FLUSH_EVERY = 12
+
+
+def clamp(value, maximum):
+    """Integer value within 0 and maximum"""
+    return max(0, min(maximum, int(value)))
+
+
+class TelemetryStore(object):
+    """Fixed-size ring of compact samples in a memory-mapped file
+
+    Two header slots are written in turn, each with a sequence number
+    and a crc, and the newest valid one is used when opening. A record
+    is always written to a slot that the current header does not cover,
+    so a crash at any point leaves a consistent file: at most capacity
+    - 1 records are kept. Timestamps are stored as the delta to the
+    previous record, the header keeps the absolute time of the oldest
+    and of the newest record.
+    """
+
+    def __init__(self, fname, capacity=HISTORY_SIZE + 1):
+        self.fname = fname
+        self.capacity = capacity
+        self.names_offset = 2 * HEADER_SLOT
+        self.records_offset = self.names_offset + NAMES * NAME_SIZE
+        self.size = self.records_offset + capacity * RECORD.size
+        self.unflushed = 0
+
+        dirname = os.path.dirname(fname)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        fd = os.open(fname, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != self.size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+            self.map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        self.view = memoryview(self.map)
+
+        self.header = self.read_header()
+        if self.header is None:
+            self.clear()
+        self.names = [
+            bytes(self.view[offset:offset + NAME_SIZE]).rstrip(
+                b"\0").decode("utf-8", "replace")
+            for offset in range(self.names_offset, self.records_offset,
+                                NAME_SIZE)]
+
+    def __len__(self):
+        return self.header["count"]
+
+    def close(self):
+        """Flush and unmap the file"""
+        if self.map is not None:
+            self.map.flush()
+            self.view.release()
+            self.map.close()
+            self.map = None
+
+    def read_header(self):
+        """Return the newest valid header as a dict, None if there is
+        none"""
+        headers = []
+        for offset in (0, HEADER_SLOT):
+            data = self.view[offset:offset + HEADER.size]
+            (crc, ) = CRC.unpack_from(self.view, offset + HEADER.size)
+            if zlib.crc32(data) & 0xffffffff != crc:
+                continue
+            (magic, version, record_size, capacity, seq, start, count,
+             first, last) = HEADER.unpack(data)
+            if (magic, version, record_size, capacity) == \
+                    (MAGIC, VERSION, RECORD.size, self.capacity) and \
+                    start < capacity and count < capacity:
+                headers.append({"seq": seq, "start": start, "count": count,
+                                "first": first, "last": last})
+        if not headers:
+            return None
+        return max(headers, key=lambda header: header["seq"])
+
+    def write_header(self, start, count, first, last):
+        """Write a header to the slot not holding the current one"""
+        seq = self.header["seq"] + 1 if self.header else 1
+        offset = (seq % 2) * HEADER_SLOT
+        HEADER.pack_into(self.view, offset, MAGIC, VERSION, RECORD.size,
+                         self.capacity, seq, start, count, first, last)
+        CRC.pack_into(self.view, offset + HEADER.size, zlib.crc32(
+            self.view[offset:offset + HEADER.size]) & 0xffffffff)
+        self.header = {"seq": seq, "start": start, "count": count,
+                       "first": first, "last": last}
+
+    def clear(self):
+        """Drop all records and names"""
+        self.view[self.names_offset:self.records_offset] = \
+            bytes(NAMES * NAME_SIZE)
+        self.names = [""] * NAMES
+        self.header = None
+        self.write_header(0, 0, 0.0, 0.0)
+        # the older slot must not be taken for a valid header later
+        self.write_header(0, 0, 0.0, 0.0)
+        self.map.flush()
+
+    def name_index(self, name):
+        """Index of name in the names table, added if missing,
+        0 if the table is full"""
+        # names are stored cut to NAME_SIZE bytes, without a partial
+        # character at the end, and looked up the same way
+        name = name.encode("utf-8")[:NAME_SIZE].decode("utf-8", "ignore")
+        if not name:
+            return 0
+        if name in self.names:
+            return self.names.index(name)
+        for index in range(1, NAMES):
+            if not self.names[index]:
+                offset = self.names_offset + index * NAME_SIZE
+                data = name.encode("utf-8")
+                self.view[offset:offset + len(data)] = data
+                self.names[index] = name
+                return index
+        return 0
+
+    def append(self, timestamp, battery, brightness, power, cpu,
+               frequency, max_frequency):
+        """Add a sample, battery is a System.get_battery reading and
+        the frequencies are in kHz"""
+        header = self.header
+        delta = int(round(1000 * (timestamp - header["last"])))
+        if header["count"] and delta > MAX_DELTA:
+            # too old to be linked by a delta
+            self.clear()
+            header = self.header
+        start, count = header["start"], header["count"]
+        index = (start + count) % self.capacity
+        RECORD.pack_into(
+            self.view, self.records_offset + index * RECORD.size,
+            clamp(delta, MAX_DELTA) if count else 0,
+            clamp(battery.get("rate", 0), 0xffff),
+            clamp(battery.get("voltage", 0), 0xffff),
+            clamp(battery.get("capacity", 0), 0xffffffff),
+            STATES.index(battery.get("state")) if battery.get(
+                "state") in STATES else 0,
+            self.name_index(power), self.name_index(cpu),
+            clamp(brightness, 0xffffffff), clamp(frequency / 1000, 0xffff),
+            clamp(max_frequency / 1000, 0xffff))
+
+        first, last = header["first"], max(header["last"], timestamp)
+        if count == 0:
+            first = last = timestamp
+        if count == self.capacity - 1:
+            # drop the oldest, the next one holds the delta to it
+            start = (start + 1) % self.capacity
+            (delta, ) = struct.unpack_from(
+                "<I", self.view, self.records_offset + start * RECORD.size)
+            first += delta / 1000
+        else:
+            count += 1
+        self.write_header(start, count, first, last)
+
+        self.unflushed += 1
+        if self.unflushed >= FLUSH_EVERY:
+            self.map.flush()
+            self.unflushed = 0
+
+    def segments(self):
+        """Return the records, oldest first, as one or two memoryviews
+        into the file of RECORD.size bytes per record"""
+        start, count = self.header["start"], self.header["count"]
+        end = start + count
+        offset = self.records_offset
+        if end <= self.capacity:
+            return [self.view[offset + start * RECORD.size:
+                              offset + end * RECORD.size]]
+        return [self.view[offset + start * RECORD.size:self.size],
+                self.view[offset:
+                          offset + (end - self.capacity) * RECORD.size]]
+
+    def records(self):
+        """Iterate over the records as dicts of FIELDS, oldest first,
+        with absolute timestamps and the state and names decoded"""
+        timestamp = self.header["first"]
+        first = True
+        for segment in self.segments():
+            for values in RECORD.iter_unpack(segment):
+                if not first:
+                    timestamp += values[0] / 1000
+                first = False
+                record = dict(zip(FIELDS, values))
+                record["timestamp"] = timestamp
+                record["state"] = STATES[values[4]] \
+                    if values[4] < len(STATES) else "unknown"
+                record["power"] = self.names[values[5]] or "unknown"
+                record["cpu"] = self.names[values[6]] or "unknown"
+                yield record
+
+
+def open_store():
+    """Open the telemetry file in STATE_DIR, None if it cannot be used"""
+    fname = os.path.join(neptune.STATE_DIR, "telemetry.bin")
+    try:
+        return TelemetryStore(fname)
+    except (IOError, OSError, ValueError) as error:
+        print("Cannot open {0}: {1}".format(fname, error))
+        return None
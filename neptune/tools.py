@@ -11,20 +11,45 @@ from __future__ import (division, absolute_import, unicode_literals,
 # pylint: disable=C0302
 
 import six
-import chardet
 import os
+import locale
 
 
-def to_unicode(output):
-    """Autodetect unicode"""
+# encodings found by chardet, per producing command
+ENCODINGS = {}
+
+
+def to_unicode(output, command=None):
+    """Autodetect unicode
+
+    Strict UTF-8 and the locale encoding are tried first, chardet is
+    only used when both fail and its result is remembered for command.
+    """
     if isinstance(output, six.text_type):
         # already unicode
         return output
     elif output is None or len(output) == 0:
         return ""
     elif isinstance(output, (six.string_types, six.binary_type)):
-        detect = chardet.detect(output)
-        return output.decode(detect["encoding"])
+        for encoding in ("utf-8", locale.getpreferredencoding(False)):
+            try:
+                return output.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                pass
+
+        # the remembered encoding only saves running chardet again, it
+        # may decode anything (latin-1) so it never goes before UTF-8
+        encoding = ENCODINGS.get(command)
+        if encoding is None:
+            import chardet
+
+            encoding = chardet.detect(output)["encoding"] or "latin-1"
+            if command is not None:
+                ENCODINGS[command] = encoding
+        try:
+            return output.decode(encoding, "replace")
+        except LookupError:
+            return output.decode("latin-1", "replace")
     else:
         return "{0}".format(output)
 
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Run blocking sysfs writes on a bounded thread pool"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import collections
+import concurrent.futures
+
+
+class ParallelWriter(object):
+    """Run groups of tasks in parallel
+
+    Tasks in the same group run in sequence, in the order they were
+    given, different groups run in parallel on at most <threads> threads.
+    Each thread takes the next waiting group when it is done with one,
+    so there is one future per thread, not per group. Fewer than
+    <min_parallel> tasks are run in sequence, as starting the threads
+    costs more than the writes.
+    """
+
+    def __init__(self, threads, min_parallel=0):
+        self.threads = threads
+        self.min_parallel = min_parallel
+
+    def run(self, tasks):
+        """Run tasks [(group, key, function, args)],
+        return {key: function(*args)}"""
+        groups = collections.OrderedDict()
+        for group, key, function, args in tasks:
+            groups.setdefault(group, []).append((key, function, args))
+
+        pending = collections.deque(groups.values())
+        if self.threads <= 1 or len(groups) <= 1 or \
+                len(tasks) < self.min_parallel:
+            return self._run_groups(pending)
+
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self.threads, len(groups))) as executor:
+            for future in [executor.submit(self._run_groups, pending)
+                           for _thread in range(min(self.threads,
+                                                    len(groups)))]:
+                results.update(future.result())
+        return results
+
+    @staticmethod
+    def _run_groups(pending):
+        """Run the tasks of the pending groups until none is left,
+        the tasks of one group in sequence"""
+        results = {}
+        while True:
+            try:
+                group_tasks = pending.popleft()
+            except IndexError:
+                return results
+            for key, function, args in group_tasks:
+                results[key] = function(*args)
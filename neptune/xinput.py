@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""XInput2 devices over a persistent X connection (python-xlib)"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+try:
+    from Xlib import X, Xatom
+    import Xlib.display
+    import Xlib.error
+    from Xlib.ext import xinput
+except ImportError:
+    xinput = None
+
+import neptune
+
+from . import tools
+
+MASTERS = (1, 2)  # xinput.MasterPointer, xinput.MasterKeyboard
+SLAVES = (3, 4)  # xinput.SlavePointer, xinput.SlaveKeyboard
+
+
+class XInput(object):
+    """Device hierarchy and "Device Enabled" state in one round trip"""
+
+    def __init__(self):
+        if xinput is None:
+            raise neptune.Error("python-xlib is not installed")
+        try:
+            self.display = Xlib.display.Display()
+        except Xlib.error.DisplayError as error:
+            raise neptune.Error("Cannot open display: {0}".format(error))
+        if not self.display.has_extension("XInputExtension"):
+            self.display.close()
+            raise neptune.Error("No XInput extension")
+        self.display.xinput_query_version()
+        self.enabled_atom = self.display.intern_atom("Device Enabled")
+        self.opcode = self.display.query_extension(
+            "XInputExtension").major_opcode
+
+    def select_events(self):
+        """Receive hierarchy and property changes, return the file
+        descriptor to watch for them"""
+        self.display.screen().root.xinput_select_events([
+            (xinput.AllDevices,
+             xinput.HierarchyChangedMask | xinput.PropertyEventMask)])
+        self.display.flush()
+        return self.display.fileno()
+
+    def read_events(self):
+        """Read the pending events, return whether devices were added,
+        removed, reattached, enabled or disabled"""
+        changed = False
+        try:
+            while self.display.pending_events():
+                event = self.display.next_event()
+                if event.type != X.GenericEvent \
+                        or event.extension != self.opcode:
+                    continue
+                if event.evtype == xinput.HierarchyChanged:
+                    changed = True
+                elif event.evtype == xinput.PropertyEvent \
+                        and event.data.property == self.enabled_atom:
+                    changed = True
+        except (Xlib.error.XError, Xlib.error.ConnectionClosedError) as error:
+            raise neptune.Error("Reading X events failed: {0}".format(error))
+        return changed
+
+    def get_devices(self):
+        """Return [(name, id, use, attachment, enabled)] of all devices"""
+        try:
+            reply = self.display.xinput_query_device(xinput.AllDevices)
+        except (Xlib.error.XError, Xlib.error.ConnectionClosedError) as error:
+            raise neptune.Error("XIQueryDevice failed: {0}".format(error))
+        devices = [
+            (tools.to_unicode(device.name, "XIQueryDevice"),
+             "{0}".format(device.deviceid), device.use,
+             "{0}".format(device.attachment), bool(device.enabled))
+            for device in reply.devices]
+        return sorted(devices, key=lambda device: int(device[1]))
+
+    def set_enabled(self, xid, enabled):
+        """Set the "Device Enabled" property"""
+        try:
+            self.display.xinput_change_device_property(
+                int(xid), self.enabled_atom, Xatom.INTEGER,
+                X.PropModeReplace, (8, [int(enabled)]))
+            self.display.sync()
+        except (Xlib.error.XError, Xlib.error.ConnectionClosedError,
+                AttributeError) as error:
+            raise neptune.Error("Cannot set device {0}: {1}".format(
+                xid, error))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8-*-
+
+"""Tests of the memory-mapped telemetry file"""
+
+from __future__ import (division, absolute_import, unicode_literals,
+                        print_function)
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from neptune.telemetry import TelemetryStore, HEADER_SLOT, NAMES
+
+BATTERY = {"state": "discharging", "rate": 1500, "voltage": 12000,
+           "capacity": 3000}
+
+
+class Crash(Exception):
+    """Raised to stop an append half-way"""
+
+
+class TelemetryTest(unittest.TestCase):
+    """Wraparound, reopening, names and crash consistency"""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp(prefix="neptune-test-")
+        self.fname = os.path.join(self.dirname, "telemetry.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    @staticmethod
+    def append(store, number):
+        """Append the sample number of a regular series"""
+        store.append(1000 + 5.5 * number, dict(BATTERY, capacity=number),
+                     number, "powersave", "ondemand", 800000, 1200000)
+
+    @staticmethod
+    def summary(store):
+        """(timestamp, capacity) of the records"""
+        return [(record["timestamp"], record["capacity"])
+                for record in store.records()]
+
+    def test_wraparound_and_reopen(self):
+        """Only the newest capacity - 1 records are kept, with their
+        timestamps, also after reopening"""
+        store = TelemetryStore(self.fname, capacity=5)
+        for number in range(11):
+            self.append(store, number)
+        expected = [(1000 + 5.5 * number, number) for number in range(7, 11)]
+        self.assertEqual(len(store), 4)
+        self.assertEqual(self.summary(store), expected)
+        store.close()
+
+        store = TelemetryStore(self.fname, capacity=5)
+        self.assertEqual(self.summary(store), expected)
+        record = list(store.records())[-1]
+        self.assertEqual((record["power"], record["cpu"], record["state"]),
+                         ("powersave", "ondemand", "discharging"))
+        self.append(store, 11)
+        self.assertEqual(self.summary(store)[-1], (1000 + 5.5 * 11, 11))
+        store.close()
+
+    def test_long_names(self):
+        """Names longer than a slot use one slot, also when they are
+        cut inside a character"""
+        store = TelemetryStore(self.fname, capacity=100)
+        for number in range(2 * NAMES):
+            store.append(1000 + number, BATTERY, 0,
+                         "a-very-long-profile-name", "gouverneur-écoénome",
+                         0, 0)
+        records = list(store.records())
+        self.assertEqual(records[-1]["power"], "a-very-long-prof")
+        self.assertEqual(records[-1]["cpu"], "gouverneur-éco")
+        self.assertEqual(len([name for name in store.names if name]), 2)
+        store.close()
+
+    def test_names_after_clear(self):
+        """The names written after a clear are found after reopening"""
+        store = TelemetryStore(self.fname, capacity=5)
+        self.append(store, 0)
+        # too long after the previous record for a delta, clears
+        store.append(1000 + 5e6, BATTERY, 0, "powersave", "ondemand", 0, 0)
+        self.assertEqual(len(store), 1)
+        store.close()
+
+        store = TelemetryStore(self.fname, capacity=5)
+        self.assertEqual([(record["power"], record["cpu"])
+                          for record in store.records()],
+                         [("powersave", "ondemand")])
+        store.close()
+
+    def test_crash_before_header(self):
+        """A record written without its header is not seen, the older
+        records are intact, also when the ring is full"""
+        store = TelemetryStore(self.fname, capacity=5)
+        for number in range(6):
+            self.append(store, number)
+        expected = self.summary(store)
+
+        def crash(*_args):
+            """Die between the record and the header"""
+            raise Crash()
+        store.write_header = crash
+        self.assertRaises(Crash, self.append, store, 6)
+        store.close()
+
+        store = TelemetryStore(self.fname, capacity=5)
+        self.assertEqual(self.summary(store), expected)
+        store.close()
+
+    def test_torn_header(self):
+        """A half-written header is ignored for the previous one"""
+        store = TelemetryStore(self.fname, capacity=5)
+        for number in range(6):
+            self.append(store, number)
+        expected = self.summary(store)
+        self.append(store, 6)
+        offset = (store.header["seq"] % 2) * HEADER_SLOT
+        store.close()
+
+        with open(self.fname, "r+b") as fobj:
+            fobj.seek(offset + 20)
+            fobj.write(b"\xff\xff\xff\xff")
+        store = TelemetryStore(self.fname, capacity=5)
+        self.assertEqual(self.summary(store), expected)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()